@@ -0,0 +1,61 @@
+"""Microbenchmark for cache hits with deep-copied and frozen values
+
+Compares Cache.read for a WMS permissions structure stored with deepcopy
+(default) and as frozen read-only structure.
+
+Usage:
+
+    python benchmarks/cache_hit.py [<number of layers>]
+"""
+import os
+import sys
+import timeit
+
+# run from source tree
+sys.path.insert(
+    0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+
+from qwc_services_core.cache import Cache  # noqa: E402
+
+
+def wms_permissions(layers):
+    """Return WMS permissions with layers.
+
+    :param int layers: Number of layers
+    """
+    return {
+        'name': 'qwc',
+        'layers': [
+            {
+                'name': 'layer%d' % idx,
+                'attributes': ['attr%d' % attr for attr in range(10)] +
+                ['geometry'],
+                'info_template': True
+            }
+            for idx in range(layers)
+        ],
+        'print_templates': ['A4 Landscape', 'A3 Portrait']
+    }
+
+
+def main(args):
+    layers = int(args[0]) if args else 2000
+    value = wms_permissions(layers)
+
+    for frozen in [False, True]:
+        cache = Cache(frozen=frozen)
+        cache.write('ogc', None, ['qwc'], value, 3600)
+        assert cache.read('ogc', None, ['qwc'])['name'] == 'qwc'
+
+        number, total = timeit.Timer(
+            lambda: cache.read('ogc', None, ['qwc'])
+        ).autorange()
+        print("%s hit (%d layers): %.3f ms" % (
+            'frozen' if frozen else 'deepcopy', layers,
+            total / number * 1000
+        ))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
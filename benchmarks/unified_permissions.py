@@ -0,0 +1,146 @@
+"""Benchmark for expanding unified permissions
+
+Generates unified permissions with layers in nested layer groups and
+compares collecting the permitted resources of all roles with a
+deep-copied resources lookup per role (previous approach) against the
+shared DataproductTree used by PermissionsReader.
+
+Usage:
+
+    python benchmarks/unified_permissions.py [<dataproducts> [<roles>]]
+"""
+from copy import deepcopy
+import logging
+import os
+import random
+import sys
+import time
+
+# run from source tree
+sys.path.insert(
+    0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+
+from qwc_services_core.permissions_reader import (  # noqa: E402
+    DataproductTree, PermissionsReader
+)
+
+
+def generate_permissions(dataproducts, roles):
+    """Return unified permissions with layers in chained layer groups.
+
+    :param int dataproducts: Number of layers
+    :param int roles: Number of roles
+    """
+    rnd = random.Random(1)
+    groups = dataproducts // 10
+    resources = [
+        {'name': 'layer%d' % idx, 'attributes': ['a', 'b', 'c']}
+        for idx in range(dataproducts)
+    ]
+    for idx in range(groups):
+        sublayers = ['layer%d' % (idx * 10 + sub) for sub in range(10)]
+        if idx + 1 < groups and idx % 3:
+            # nested group
+            sublayers.append('group%d' % (idx + 1))
+        resources.append({'name': 'group%d' % idx, 'sublayers': sublayers})
+
+    role_permissions = []
+    for idx in range(roles):
+        all_services = {}
+        for group in rnd.sample(range(groups), min(groups, 20)):
+            all_services['group%d' % group] = {'writable': bool(idx % 2)}
+        role_permissions.append({
+            'role': 'role%d' % idx,
+            'permissions': {'all_services': all_services}
+        })
+
+    return {
+        'users': [], 'groups': [], 'roles': role_permissions,
+        'wms_name': 'qwc', 'wfs_name': 'qwc', 'dataproducts': resources,
+        'common_resources': []
+    }
+
+
+def deepcopy_collect_resources(parent_resources, resources_lookup):
+    """Recursively collect resources, marking processed resources in the
+    role's copy of the resources lookup (previous approach).
+
+    :param list<obj> parent_resources: Parent resources
+    :param obj resources_lookup: Copy of resources lookup
+    """
+    resources = []
+    for resource in parent_resources:
+        lookup = resources_lookup.get(resource['name'], {})
+        resource.update(lookup)
+        if 'processed' in lookup:
+            continue
+        resources.append(resource)
+        lookup['processed'] = True
+
+        if 'sublayers' in resource:
+            resources += deepcopy_collect_resources(
+                [{'name': name} for name in resource['sublayers']],
+                resources_lookup
+            )
+
+    return resources
+
+
+def main(args):
+    dataproducts = int(args[0]) if len(args) > 0 else 5000
+    roles = int(args[1]) if len(args) > 1 else 200
+    permissions = generate_permissions(dataproducts, roles)
+    resources_lookup = {
+        resource['name']: resource
+        for resource in permissions['dataproducts']
+    }
+    logger = logging.getLogger()
+
+    # previous approach with deep-copied resources lookup per role
+    start = time.perf_counter()
+    deepcopy_results = []
+    for role in permissions['roles']:
+        role_lookup = deepcopy(resources_lookup)
+        all_services = []
+        for name, resource in role['permissions']['all_services'].items():
+            all_services.append({'name': name})
+            if 'writable' in resource:
+                role_lookup.get(name, {})['writable'] = resource['writable']
+        deepcopy_results.append(
+            deepcopy_collect_resources(all_services, role_lookup)
+        )
+    deepcopy_time = time.perf_counter() - start
+
+    # shared dataproduct tree with per-role state
+    start = time.perf_counter()
+    reader = PermissionsReader.__new__(PermissionsReader)
+    dataproduct_tree = DataproductTree(resources_lookup, logger)
+    shared_results = []
+    for role in permissions['roles']:
+        all_services = role['permissions']['all_services']
+        writable = {
+            name: resource['writable']
+            for name, resource in all_services.items()
+            if 'writable' in resource and name in resources_lookup
+        }
+        shared_results.append(reader.collect_resources(
+            list(all_services.keys()), dataproduct_tree, writable
+        ))
+    shared_time = time.perf_counter() - start
+
+    # compare permitted resources
+    for deepcopy_resources, shared_resources in zip(
+        deepcopy_results, shared_results
+    ):
+        for resource in deepcopy_resources:
+            resource.pop('processed', None)
+        assert deepcopy_resources == shared_resources
+
+    print("%d dataproducts, %d roles" % (dataproducts, roles))
+    print("deepcopy per role: %.2f s" % deepcopy_time)
+    print("shared tree: %.2f s" % shared_time)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
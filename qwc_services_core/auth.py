@@ -2,7 +2,8 @@
 """
 import os
 import re
-from flask import request
+from flask import g, request
+from .identity import Identity
 from .jwt import jwt_manager
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
@@ -31,6 +32,8 @@ def get_identity():
 
 def get_username(identity):
     """Get username"""
+    if isinstance(identity, Identity):
+        return identity.username
     if identity:
         if isinstance(identity, dict):
             username = identity.get('username')
@@ -44,10 +47,13 @@ def get_username(identity):
 
 def get_groups(identity):
     """Get user groups"""
+    if isinstance(identity, Identity):
+        return list(identity.groups)
     groups = []
     if identity:
         if isinstance(identity, dict):
-            groups = identity.get('groups', [])
+            # NOTE: copy groups to keep identity unchanged
+            groups = list(identity.get('groups') or [])
             group = identity.get('group')
             if group:
                 groups.append(group)
@@ -65,6 +71,15 @@ def get_auth_user():
     return identity
 
 
+def get_request_identity():
+    """Get Identity for get_auth_user(), memoized for the current request"""
+    identity = g.get('request_identity')
+    if identity is None:
+        identity = Identity(get_auth_user())
+        g.request_identity = identity
+    return identity
+
+
 class GroupNameMapper:
     """Group name mapping with regular expressions"""
 
@@ -1,25 +1,105 @@
+from collections import OrderedDict
+from types import MappingProxyType
+import hashlib
+import os
+import pickle
+import struct
+import threading
 import time
 import copy
 
+from .file_utils import atomic_write, private_dir
+from .identity import Identity
+
+
+def cache_codec(name):
+    """Return (<dumps>, <loads>) functions for a serialization codec.
+
+    NOTE: msgpack and orjson have to be installed separately and only support
+          JSON-like values.
+
+    :param str name: Codec name ('pickle', 'msgpack' or 'orjson')
+    """
+    if name == 'pickle':
+        return (
+            lambda value: pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+            pickle.loads
+        )
+    elif name == 'msgpack':
+        import msgpack
+        return (
+            msgpack.packb,
+            lambda data: msgpack.unpackb(data, raw=False)
+        )
+    elif name == 'orjson':
+        import orjson
+        return (orjson.dumps, orjson.loads)
+    else:
+        raise Exception("Unknown cache codec '%s'" % name)
+
+
+def freeze(value):
+    """Return read-only copy of a value, converting any dicts to mapping
+    proxies, lists to tuples and sets to frozensets.
+
+    :param obj value: Value to freeze
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({
+            key: freeze(val) for key, val in value.items()
+        })
+    elif isinstance(value, (list, tuple)):
+        return tuple(freeze(val) for val in value)
+    elif isinstance(value, set):
+        return frozenset(value)
+    else:
+        return value
+
 
 class ExpiringDict:
-    """Dict for values where each key will expire after some time."""
+    """Dict for values where each key will expire after some time.
 
-    def __init__(self):
-        """Constructor"""
+    Access is synchronized, so an ExpiringDict may be shared between threads.
+    """
+
+    def __init__(self, max_entries=None):
+        """Constructor
+
+        :param int max_entries: Optional max number of entries, least recently
+                                used entries are evicted if exceeded
+        """
         self.cache = {}
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
 
-    def set(self, key, value, duration=300):
+    def set(self, key, value, duration=300, frozen=False):
         """Store value under key until expiry.
 
         :param str key: Key for value
         :param obj value: Value to store
         :param int duration: Time in seconds until expiry (default: 300s)
+        :param bool frozen: Store value as read-only structure which is
+                            returned without copying on lookup
         """
-        self.cache[key] = {
-            'value': copy.deepcopy(value),
-            'expires': time.time() + duration
+        if frozen:
+            value = freeze(value)
+        else:
+            value = copy.deepcopy(value)
+
+        entry = {
+            'value': value,
+            'expires': time.time() + duration,
+            'frozen': frozen
         }
+        with self.lock:
+            # NOTE: re-insert key to mark it as most recently used
+            self.cache.pop(key, None)
+            self.cache[key] = entry
+
+            if self.max_entries is not None:
+                while len(self.cache) > self.max_entries:
+                    # evict least recently used entry
+                    del self.cache[next(iter(self.cache))]
 
     def lookup(self, key):
         """Return dict with value or None if not present or expired.
@@ -30,50 +110,114 @@ class ExpiringDict:
         """
         res = None
 
-        if key in self.cache:
-            entry = self.cache[key]
-            # check expiry
-            if time.time() < entry['expires']:
-                # return value
-                res = {'value':  copy.deepcopy(entry['value'])}
+        entry = self.lookup_entry(key)
+        if entry is not None:
+            # return value
+            if entry['frozen']:
+                res = {'value': entry['value']}
             else:
-                # remove expired value
-                del self.cache[key]
+                res = {'value':  copy.deepcopy(entry['value'])}
 
         return res
 
+    def lookup_entry(self, key):
+        """Return stored entry without copying its value, or None if not
+        present or expired.
 
-class Cache():
-    """Nested dict for values where each key will expire after some time."""
+        :param str key: Key for value
+
+        Returns {'value': <value>, 'expires': <timestamp>, 'frozen': <bool>}
+        """
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is not None:
+                # check expiry
+                if time.time() < entry['expires']:
+                    if self.max_entries is not None:
+                        # mark as most recently used
+                        self.cache[key] = self.cache.pop(key)
+                else:
+                    # remove expired value
+                    del self.cache[key]
+                    entry = None
+
+        return entry
+
+    def expired(self, key):
+        """Return whether value for key is missing or expired.
+
+        :param str key: Key for value
+        """
+        entry = self.cache.get(key)
+        return entry is None or time.time() >= entry['expires']
+
+    def remove(self, key):
+        """Remove value for key if present.
+
+        :param str key: Key for value
+        """
+        with self.lock:
+            self.cache.pop(key, None)
+
+    def expire(self):
+        """Remove all expired values and return number of removed entries."""
+        now = time.time()
+        with self.lock:
+            expired_keys = [
+                key for key, entry in self.cache.items()
+                if now >= entry['expires']
+            ]
+            for key in expired_keys:
+                del self.cache[key]
+
+        return len(expired_keys)
+
+    def __len__(self):
+        return len(self.cache)
+
+
+class EntryCounter():
+    """Thread-safe number of entries shared by all CacheStripes"""
 
     def __init__(self):
-        self.init()
+        self.lock = threading.Lock()
+        self.value = 0
 
-    def init(self):
-        self.cache = {}
+    def add(self, delta):
+        """Add delta and return new number of entries.
 
-    def identity_keys(self, identity):
-        """Return [group, username] for identity.
+        :param int delta: Number of added (or removed if negative) entries
+        """
+        with self.lock:
+            self.value += delta
+            return self.value
 
-        :param obj identity: User name or Identity dict
+
+class CacheStripe():
+    """Partition of a Cache with its own lock, nested dict and LRU index."""
+
+    def __init__(self, counter, sweep_interval):
+        """Constructor
+
+        :param EntryCounter counter: Number of entries in all stripes
+        :param int sweep_interval: Interval in seconds for removing expired
+                                   entries
         """
-        if identity is not None:
-            if isinstance(identity, dict):
-                return [
-                    identity.get('group'),
-                    identity.get('username')
-                ]
-            else:
-                # identity is username
-                return [None, identity]
-        else:
-            # keys for empty user
-            return [None, '_public_']
+        self.counter = counter
+        self.sweep_interval = sweep_interval
+        self.lock = threading.Lock()
+        self.cache = {}
+        # LRU index as OrderedDict of {<cache keys tuple>: <ExpiringDict>}
+        self.lru = OrderedDict()
+        self.next_sweep = time.time() + sweep_interval
+
+    def cache_entry(self, cache_keys):
+        """Return (<ExpiringDict>, <key>) for cache keys, creating any
+        missing levels.
 
-    def cache_entry(self, service, identity, keys):
+        :param tuple cache_keys: Nesting level keys
+        """
         # cache is a nested dict with the following levels:
-        cache_keys = [service] + self.identity_keys(identity) + list(keys)
-        # print("cache_entry %s" % cache_keys)
         cache = self.cache
 
         # read or initialize cache level by level
@@ -94,17 +238,606 @@ class Cache():
         key = cache_keys[-1]
         return (entry, key)
 
-    def read(self, service, identity, keys):
-        cache, key = self.cache_entry(service, identity, keys)
-        entry = cache.lookup(key)
-        if entry:
-            # print("Reading data from cache with key '%s'" % key)
-            return entry['value']
+    def find_entry(self, cache_keys):
+        """Return (<ExpiringDict>, <key>) for cache keys without creating
+        any missing levels, or (None, None) if not present.
+
+        :param tuple cache_keys: Nesting level keys
+        """
+        cache = self.cache
+        for key in cache_keys[:-1]:
+            cache = cache.get(key)
+            if cache is None:
+                return (None, None)
+
+        return (cache, cache_keys[-1])
+
+    def remove(self, cache_keys):
+        """Remove cache entry and prune any empty nesting levels.
+
+        NOTE: caller has to hold the stripe lock
+
+        :param tuple cache_keys: Nesting level keys
+        """
+        if self.lru.pop(cache_keys, None) is not None:
+            self.counter.add(-1)
+
+        # collect path of (<parent level>, <key>) down to entry
+        path = []
+        cache = self.cache
+        for key in cache_keys[:-1]:
+            entry = cache.get(key)
+            if entry is None:
+                return
+            path.append((cache, key))
+            cache = entry
+
+        cache.remove(cache_keys[-1])
+
+        # prune empty levels from the bottom up
+        for parent, key in reversed(path):
+            if len(parent[key]) > 0:
+                break
+            del parent[key]
+
+    def sweep(self):
+        """Remove all expired cache entries.
+
+        NOTE: caller has to hold the stripe lock
+        """
+        expired_keys = [
+            cache_keys for cache_keys, cache in self.lru.items()
+            if cache.expired(cache_keys[-1])
+        ]
+        for cache_keys in expired_keys:
+            self.remove(cache_keys)
+
+        self.next_sweep = time.time() + self.sweep_interval
+
+    def read(self, cache_keys):
+        """Return stored entry without copying its value, or None if not
+        present or expired.
+
+        :param tuple cache_keys: Nesting level keys
+        """
+        with self.lock:
+            cache, key = self.find_entry(cache_keys)
+            if cache is None:
+                return None
+
+            entry = cache.lookup_entry(key)
+            if entry is not None:
+                if cache_keys in self.lru:
+                    # mark as most recently used
+                    self.lru.move_to_end(cache_keys)
+            else:
+                # remove any expired entry
+                self.remove(cache_keys)
+
+        return entry
+
+    def write(self, cache_keys, data, cache_duration, frozen):
+        """Store data in stripe.
+
+        :param tuple cache_keys: Nesting level keys
+        :param obj data: Data to store
+        :param int cache_duration: Time in seconds until expiry
+        :param bool frozen: Store data as read-only structure
+        """
+        with self.lock:
+            if time.time() >= self.next_sweep:
+                self.sweep()
+
+            cache, key = self.cache_entry(cache_keys)
+            cache.set(key, data, cache_duration, frozen)
+
+            if cache_keys not in self.lru:
+                self.counter.add(1)
+            self.lru[cache_keys] = cache
+            self.lru.move_to_end(cache_keys)
+
+    def evict(self, exclude):
+        """Remove least recently used entry and return whether any entry
+        was removed.
+
+        :param tuple exclude: Cache keys of entry to keep
+        """
+        with self.lock:
+            for cache_keys in self.lru:
+                if cache_keys != exclude:
+                    self.remove(cache_keys)
+                    return True
+
+        return False
+
+
+class CacheBackend():
+    """Cache backend interface
+
+    Stores values for tuples of cache keys.
+    """
+
+    def read(self, cache_keys):
+        """Return dict with value or None if not present or expired.
+
+        :param tuple cache_keys: Nesting level keys
+
+        Returns {'value': <value>} or None
+        """
+        raise NotImplementedError
+
+    def write(self, cache_keys, data, cache_duration, frozen):
+        """Store data until expiry.
+
+        :param tuple cache_keys: Nesting level keys
+        :param obj data: Data to store
+        :param int cache_duration: Time in seconds until expiry
+        :param bool frozen: Store data as read-only structure
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        """Remove all entries."""
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """In-process cache backend
+
+    Entries are partitioned by hash into a number of CacheStripes, each with
+    its own lock, so concurrent lookups of different keys rarely block each
+    other. If max_entries is exceeded, the least recently used entry of the
+    written stripe is evicted, or of the following stripes if it is empty.
+    NOTE: max_entries may be exceeded briefly by concurrent writes.
+    """
+
+    def __init__(self, max_entries=None, sweep_interval=60, stripes=16):
+        """Constructor
+
+        :param int max_entries: Optional max number of cache entries
+        :param int sweep_interval: Interval in seconds for removing expired
+                                   entries
+        :param int stripes: Number of lock stripes
+        """
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        self.num_stripes = max(stripes, 1)
+        self.clear()
+
+    def clear(self):
+        # NOTE: count entries across stripes, so max_entries is the total
+        #       bound independent of how keys are distributed
+        self.counter = EntryCounter()
+        self.stripes = [
+            CacheStripe(self.counter, self.sweep_interval)
+            for i in range(self.num_stripes)
+        ]
+
+    def stripe_index(self, cache_keys):
+        """Return index of cache stripe for cache keys.
+
+        :param tuple cache_keys: Nesting level keys
+        """
+        return hash(cache_keys) % self.num_stripes
+
+    def stripe(self, cache_keys):
+        """Return cache stripe for cache keys.
+
+        :param tuple cache_keys: Nesting level keys
+        """
+        return self.stripes[self.stripe_index(cache_keys)]
+
+    def read(self, cache_keys):
+        entry = self.stripe(cache_keys).read(cache_keys)
+        if entry is None:
+            return None
+
+        # NOTE: copy outside of stripe lock
+        if entry['frozen']:
+            return {'value': entry['value']}
+        else:
+            return {'value': copy.deepcopy(entry['value'])}
+
+    def write(self, cache_keys, data, cache_duration, frozen):
+        index = self.stripe_index(cache_keys)
+        stripes = self.stripes
+        counter = self.counter
+        stripes[index].write(cache_keys, data, cache_duration, frozen)
+
+        if self.max_entries is None:
+            return
+        while counter.value > self.max_entries:
+            # evict from written stripe first, then from following stripes
+            for offset in range(self.num_stripes):
+                stripe = stripes[(index + offset) % self.num_stripes]
+                if stripe.evict(cache_keys):
+                    break
+            else:
+                # no other entries left
+                break
+
+
+class SharedCacheBackend(CacheBackend):
+    """Cache backend shared between processes
+
+    Entries are stored as serialized files in a shared directory, preferably
+    on tmpfs (e.g. /dev/shm), so all worker processes on a host share one
+    cache. Files are replaced atomically on write.
+
+    Expired entries are swept every sweep_interval seconds on write. If
+    max_entries is exceeded, the least recently written entries are evicted.
+
+    NOTE: the cache directory is created with mode 0700 and is refused if
+          it is not owned by the current user or accessible by others, as
+          entries are deserialized on read (e.g. unpickled).
+    """
+
+    # file header with expiry timestamp and frozen flag
+    HEADER = struct.Struct('<dB')
+
+    def __init__(self, path, codec='pickle', max_entries=None,
+                 sweep_interval=60):
+        """Constructor
+
+        :param str path: Shared cache directory
+        :param str codec: Serialization codec ('pickle', 'msgpack' or
+                          'orjson')
+        :param int max_entries: Optional max number of cache entries
+        :param int sweep_interval: Interval in seconds for removing expired
+                                   entries
+        """
+        self.path = path
+        self.dumps, self.loads = cache_codec(codec)
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        self.sweep_lock = threading.Lock()
+        self.next_sweep = time.time() + sweep_interval
+
+        private_dir(path)
+
+    def entry_path(self, cache_keys):
+        """Return file path for cache keys.
+
+        :param tuple cache_keys: Nesting level keys
+        """
+        digest = hashlib.sha1(repr(cache_keys).encode('utf-8')).hexdigest()
+        return os.path.join(self.path, digest)
+
+    def read(self, cache_keys):
+        path = self.entry_path(cache_keys)
+        try:
+            with open(path, 'rb') as fh:
+                data = fh.read()
+        except FileNotFoundError:
+            return None
+
+        try:
+            expires, frozen = self.HEADER.unpack_from(data)
+        except struct.error:
+            # remove invalid entry
+            self.remove_file(path)
+            return None
+        if time.time() >= expires:
+            # remove expired value
+            self.remove_file(path)
+            return None
+
+        try:
+            value = self.loads(data[self.HEADER.size:])
+        except Exception:
+            # remove invalid entry
+            self.remove_file(path)
+            return None
+        if frozen:
+            value = freeze(value)
+        return {'value': value}
+
+    def write(self, cache_keys, data, cache_duration, frozen):
+        if time.time() >= self.next_sweep:
+            self.sweep()
+
+        # NOTE: store raw data, as serialization already returns a copy
+        payload = self.HEADER.pack(
+            time.time() + cache_duration, bool(frozen)
+        ) + self.dumps(data)
+
+        atomic_write(self.entry_path(cache_keys), [payload], 0o600)
+
+    def clear(self):
+        for entry in os.scandir(self.path):
+            self.remove_file(entry.path)
+
+    def sweep(self):
+        """Remove all expired entries and evict least recently written
+        entries exceeding max_entries."""
+        if not self.sweep_lock.acquire(blocking=False):
+            # sweep already in progress
+            return
+
+        try:
+            now = time.time()
+            entries = []
+            for entry in os.scandir(self.path):
+                if entry.name.startswith('.'):
+                    # skip temp files
+                    continue
+                try:
+                    with open(entry.path, 'rb') as fh:
+                        header = fh.read(self.HEADER.size)
+                    expires, frozen = self.HEADER.unpack(header)
+                    if now >= expires:
+                        self.remove_file(entry.path)
+                    else:
+                        entries.append((entry.stat().st_mtime, entry.path))
+                except (OSError, struct.error):
+                    # entry removed or replaced concurrently
+                    continue
+
+            if self.max_entries is not None:
+                entries.sort()
+                for mtime, path in entries[:-self.max_entries]:
+                    self.remove_file(path)
+
+            self.next_sweep = time.time() + self.sweep_interval
+        finally:
+            self.sweep_lock.release()
+
+    def remove_file(self, path):
+        """Remove file, ignoring if already removed.
+
+        :param str path: File path
+        """
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class CacheFlight():
+    """Pending computation of a cache value shared by concurrent callers"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Cache():
+    """Nested dict for values where each key will expire after some time.
+
+    The total number of entries may be limited by max_entries (default from
+    env CACHE_MAX_ENTRIES), in which case least recently used entries are
+    evicted. Expired entries are swept every sweep_interval seconds on write
+    (default from env CACHE_SWEEP_INTERVAL) and empty nesting levels are
+    pruned.
+
+    If frozen is set, values are stored as read-only structures (see freeze())
+    and returned without copying. NOTE: frozen values contain mapping proxies
+    and tuples instead of dicts and lists.
+
+    Entries are stored in a CacheBackend, selected by env CACHE_BACKEND:
+      * 'memory': thread-safe in-process cache with lock striping
+                  (number of stripes from env CACHE_LOCK_STRIPES) (default)
+      * 'shared': cache shared between processes in directory
+                  CACHE_SHARED_PATH, serialized with codec CACHE_CODEC
+
+    Use get_or_compute() to coalesce concurrent misses for expensive values.
+    """
+
+    def __init__(self, max_entries=None, sweep_interval=None, frozen=False,
+                 stripes=None, backend=None):
+        """Constructor
+
+        :param int max_entries: Optional max number of cache entries
+                                (unlimited if None or 0)
+        :param int sweep_interval: Interval in seconds for removing expired
+                                   entries (default: 60s)
+        :param bool frozen: Store values as read-only structures by default
+        :param int stripes: Number of lock stripes for memory backend
+                            (default: 16)
+        :param CacheBackend backend: Optional custom cache backend
+        """
+        if max_entries is None:
+            max_entries = int(os.environ.get('CACHE_MAX_ENTRIES', 0))
+        if sweep_interval is None:
+            sweep_interval = int(os.environ.get('CACHE_SWEEP_INTERVAL', 60))
+        if stripes is None:
+            stripes = int(os.environ.get('CACHE_LOCK_STRIPES', 16))
+        self.max_entries = max_entries or None
+        self.sweep_interval = sweep_interval
+        self.frozen = frozen
+
+        if backend is None:
+            backend_name = os.environ.get('CACHE_BACKEND', 'memory')
+            if backend_name == 'memory':
+                backend = MemoryCacheBackend(
+                    self.max_entries, sweep_interval, stripes
+                )
+            elif backend_name == 'shared':
+                backend = SharedCacheBackend(
+                    os.environ.get(
+                        'CACHE_SHARED_PATH', '/dev/shm/qwc_services_cache'
+                    ),
+                    os.environ.get('CACHE_CODEC', 'pickle'),
+                    self.max_entries, sweep_interval
+                )
+            else:
+                raise Exception(
+                    "Unknown cache backend '%s'" % backend_name
+                )
+        self.backend = backend
+
+        # pending computations as {<cache keys tuple>: <CacheFlight>}
+        self.flights = {}
+        self.flights_lock = threading.Lock()
+
+    def init(self):
+        self.backend.clear()
+
+    def identity_keys(self, identity):
+        """Return [group, username] for identity.
+
+        :param obj identity: User name, Identity dict or Identity
+        """
+        if isinstance(identity, Identity):
+            if identity.identity is None:
+                return [None, '_public_']
+            return [identity.group, identity.username]
+        if identity is not None:
+            if isinstance(identity, dict):
+                return [
+                    identity.get('group'),
+                    identity.get('username')
+                ]
+            else:
+                # identity is username
+                return [None, identity]
         else:
+            # keys for empty user
+            return [None, '_public_']
+
+    def cache_keys(self, service, identity, keys):
+        """Return tuple of all nesting level keys for a cache entry.
+
+        :param str service: Service name
+        :param obj identity: User name or Identity dict
+        :param list keys: Additional cache keys
+        """
+        return tuple([service] + self.identity_keys(identity) + list(keys))
+
+    def read(self, service, identity, keys):
+        """Return cached data or None if not present or expired.
+
+        :param str service: Service name
+        :param obj identity: User name or Identity dict
+        :param list keys: Additional cache keys
+        """
+        entry = self.backend.read(self.cache_keys(service, identity, keys))
+        if entry is None:
             return None
 
+        return entry['value']
+
     def write(self, service, identity, keys, data,
-              cache_duration):
-        cache, key = self.cache_entry(service, identity, keys)
-        # print("Writing data into cache with key '%s'" % key)
-        cache.set(key, data, cache_duration)
+              cache_duration, frozen=None):
+        """Store data in cache.
+
+        :param str service: Service name
+        :param obj identity: User name or Identity dict
+        :param list keys: Additional cache keys
+        :param obj data: Data to store
+        :param int cache_duration: Time in seconds until expiry
+        :param bool frozen: Override Cache default for storing data as
+                            read-only structure
+        """
+        if frozen is None:
+            frozen = self.frozen
+
+        self.backend.write(
+            self.cache_keys(service, identity, keys), data, cache_duration,
+            frozen
+        )
+
+    def get_or_compute(self, service, identity, keys, fn, cache_duration,
+                       stale_duration=0, frozen=None):
+        """Return cached data or compute and store it on a miss.
+
+        Concurrent misses for the same keys within this process are
+        coalesced, so fn() is called only once while other callers wait for
+        its result.
+
+        If stale_duration is set, expired data is still returned for up to
+        stale_duration seconds, while a single background thread refreshes
+        it. NOTE: fn() must not depend on the request context in this case.
+
+        NOTE: data is stored together with its refresh time and should only
+              be read with get_or_compute().
+
+        :param str service: Service name
+        :param obj identity: User name or Identity dict
+        :param list keys: Additional cache keys
+        :param func fn: Function without arguments returning data
+        :param int cache_duration: Time in seconds until refresh
+        :param int stale_duration: Time in seconds to serve expired data
+                                   while refreshing in background
+        :param bool frozen: Override Cache default for storing data as
+                            read-only structure
+        """
+        if frozen is None:
+            frozen = self.frozen
+
+        cache_keys = self.cache_keys(service, identity, keys)
+
+        def compute():
+            data = fn()
+            self.backend.write(
+                cache_keys, (data, time.time() + cache_duration),
+                cache_duration + stale_duration, frozen
+            )
+            if frozen:
+                data = freeze(data)
+            return data
+
+        entry = self.backend.read(cache_keys)
+        if entry is not None:
+            data, refresh = entry['value']
+            if time.time() >= refresh:
+                # serve stale data and refresh in background
+                self.single_flight(cache_keys, compute, background=True)
+            return data
+
+        data, leader = self.single_flight(cache_keys, compute)
+        if not leader and not frozen:
+            # NOTE: do not share result between callers
+            data = copy.deepcopy(data)
+        return data
+
+    def single_flight(self, cache_keys, compute, background=False):
+        """Run compute() unless already pending for the same keys and
+        return (<result>, <whether this caller computed it>).
+
+        :param tuple cache_keys: Nesting level keys
+        :param func compute: Function without arguments returning result
+        :param bool background: Compute in background thread and return
+                                immediately
+        """
+        with self.flights_lock:
+            flight = self.flights.get(cache_keys)
+            leader = flight is None
+            if leader:
+                flight = CacheFlight()
+                self.flights[cache_keys] = flight
+
+        if background:
+            if leader:
+                threading.Thread(
+                    target=self.run_flight,
+                    args=(cache_keys, flight, compute),
+                    daemon=True
+                ).start()
+            return (None, leader)
+
+        if leader:
+            self.run_flight(cache_keys, flight, compute)
+        else:
+            flight.event.wait()
+
+        if flight.error is not None:
+            raise flight.error
+        return (flight.result, leader)
+
+    def run_flight(self, cache_keys, flight, compute):
+        """Run compute() for pending flight and notify waiting callers.
+
+        :param tuple cache_keys: Nesting level keys
+        :param CacheFlight flight: Pending flight
+        :param func compute: Function without arguments returning result
+        """
+        try:
+            flight.result = compute()
+        except Exception as e:
+            flight.error = e
+        finally:
+            with self.flights_lock:
+                self.flights.pop(cache_keys, None)
+            flight.event.set()
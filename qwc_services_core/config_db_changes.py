@@ -0,0 +1,168 @@
+import os
+import threading
+import weakref
+
+from sqlalchemy import func, select
+
+
+# watchers for restarting polling threads after fork
+WATCHERS = weakref.WeakSet()
+
+
+def after_fork_in_child():
+    """Restart polling threads of all watchers in child process."""
+    for watcher in list(WATCHERS):
+        watcher.after_fork()
+
+
+os.register_at_fork(after_in_child=after_fork_in_child)
+
+
+class ConfigDBChangeWatcher():
+    """ConfigDBChangeWatcher class
+
+    Poll the ConfigDB last_update table in a background thread and notify
+    callbacks on any change, e.g. to invalidate cached permissions or
+    service handlers derived from ConfigDB, so long cache durations may be
+    used while admin changes still become visible within the poll interval.
+
+    The poll interval in seconds is set by env CONFIGDB_POLL_INTERVAL
+    (default: 10).
+
+    NOTE: last_update has no details about changed entries, so callbacks
+          should invalidate all data derived from this ConfigDB.
+    """
+
+    def __init__(self, config_models, logger, interval=None):
+        """Constructor
+
+        :param ConfigModels config_models: Helper for ORM models
+        :param Logger logger: Application logger
+        :param float interval: Optional poll interval in seconds
+        """
+        self.config_models = config_models
+        self.logger = logger
+        if interval is None:
+            interval = float(os.environ.get('CONFIGDB_POLL_INTERVAL', 10))
+        self.interval = interval
+
+        # callbacks as [<func>]
+        self.callbacks = []
+        # last seen timestamp of last_update
+        self.updated_at = None
+        self.started = False
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        WATCHERS.add(self)
+
+    def add_callback(self, callback):
+        """Add callback without arguments called on ConfigDB changes.
+
+        :param func callback: Function called on changes
+        """
+        self.callbacks.append(callback)
+
+    def invalidate_cache(self, cache):
+        """Clear cache on ConfigDB changes.
+
+        :param Cache cache: Cache
+        """
+        self.add_callback(cache.init)
+
+    def invalidate_handlers(self, tenant_handler, tenant, handler_names):
+        """Evict service handlers for tenant on ConfigDB changes.
+
+        :param TenantHandler tenant_handler: Tenant handler
+        :param str tenant: Tenant ID
+        :param list handler_names: Handler names
+        """
+        def evict_handlers():
+            for handler_name in handler_names:
+                tenant_handler.evict_handler(handler_name, tenant)
+
+        self.add_callback(evict_handlers)
+
+    def last_update(self):
+        """Return timestamp of last ConfigDB update or None if not set."""
+        last_update_table = self.config_models.base.metadata.tables[
+            'qwc_config.last_update'
+        ]
+        with self.config_models.engine.connect() as conn:
+            return conn.execute(
+                select(func.max(last_update_table.c.updated_at))
+            ).scalar()
+
+    def start(self):
+        """Start polling for ConfigDB changes in background thread."""
+        if self.thread is not None:
+            return
+
+        self.started = True
+        try:
+            self.updated_at = self.last_update()
+        except Exception as e:
+            self.logger.error(
+                "Could not read ConfigDB last update:\n%s" % e
+            )
+        self.start_thread(False)
+
+    def start_thread(self, check):
+        """Start background polling thread.
+
+        :param bool check: Check for changes immediately
+        """
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, args=(self.stop_event, check), daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        """Stop polling for ConfigDB changes."""
+        self.started = False
+        self.stop_event.set()
+        self.thread = None
+
+    def after_fork(self):
+        """Restart polling thread in child process."""
+        self.thread = None
+        if self.started:
+            # NOTE: keep last seen update of parent and check from thread,
+            #       so changes since the last poll in the parent are
+            #       reported without blocking the fork
+            self.start_thread(True)
+
+    def run(self, stop_event, check=False):
+        """Poll for ConfigDB changes until stopped.
+
+        :param Event stop_event: Event for stopping this thread
+        :param bool check: Check for changes immediately
+        """
+        if check:
+            self.check()
+        while not stop_event.wait(self.interval):
+            self.check()
+
+    def check(self):
+        """Check for ConfigDB changes and notify callbacks."""
+        try:
+            updated_at = self.last_update()
+        except Exception as e:
+            self.logger.error(
+                "Could not read ConfigDB last update:\n%s" % e
+            )
+            return
+
+        if updated_at == self.updated_at:
+            return
+        self.updated_at = updated_at
+
+        self.logger.info("ConfigDB changed at %s" % updated_at)
+        for callback in list(self.callbacks):
+            try:
+                callback()
+            except Exception as e:
+                self.logger.error(
+                    "Error in ConfigDB change callback:\n%s" % e
+                )
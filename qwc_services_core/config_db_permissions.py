@@ -0,0 +1,167 @@
+from sqlalchemy import select
+
+
+class ConfigDBPermissionsLoader():
+    """ConfigDBPermissionsLoader class
+
+    Load users, groups, roles and permissions from ConfigDB with a few
+    set-based queries instead of walking ORM relationships.
+
+    Users and groups are returned with their roles as in
+    PermissionsReader.load_permissions. Role permissions are raw ConfigDB
+    resource permissions grouped by resource type (not the service
+    permissions of permissions.json), e.g.
+        {
+            <role>: {
+                <resource type>: [
+                    {
+                        name: <resource name>,
+                        parent: <parent resource name or None>,
+                        writable: <write permission>,
+                        priority: <priority>
+                    }
+                ]
+            }
+        }
+    sorted by descending priority and name.
+
+    NOTE: resource names are not unique (e.g. attributes of different
+          layers), use parent to distinguish them.
+    """
+
+    def __init__(self, config_models, logger):
+        """Constructor
+
+        :param ConfigModels config_models: Helper for ORM models
+        :param Logger logger: Application logger
+        """
+        self.config_models = config_models
+        self.logger = logger
+
+    def table(self, name):
+        """Return reflected ConfigDB table.
+
+        :param str name: Table name
+        """
+        return self.config_models.base.metadata.tables['qwc_config.%s' % name]
+
+    def load_permissions(self):
+        """Load users, groups, roles and permissions from ConfigDB.
+
+        Returns lookup dict as:
+            {
+                users: {
+                    <user>: [<role>]
+                }
+                groups: {
+                    <group>: [<role>]
+                },
+                roles: {
+                    <role>: {
+                        <resource type>: [<resource permission>]
+                    }
+                }
+            }
+        """
+        users_table = self.table('users')
+        groups_table = self.table('groups')
+        roles_table = self.table('roles')
+        groups_users = self.table('groups_users')
+        users_roles = self.table('users_roles')
+        groups_roles = self.table('groups_roles')
+        resources_table = self.table('resources')
+        permissions_table = self.table('permissions')
+        parents_table = resources_table.alias('parents')
+
+        self.logger.info("Reading permissions from ConfigDB")
+        with self.config_models.engine.connect() as conn:
+            # collect group roles
+            groups = {}
+            for row in conn.execute(select(groups_table.c.name)):
+                groups[row.name] = []
+            query = select(
+                groups_table.c.name.label('group_name'),
+                roles_table.c.name.label('role_name')
+            ).select_from(
+                groups_roles
+                .join(groups_table,
+                      groups_roles.c.group_id == groups_table.c.id)
+                .join(roles_table,
+                      groups_roles.c.role_id == roles_table.c.id)
+            ).order_by(roles_table.c.name)
+            for row in conn.execute(query):
+                groups[row.group_name].append(row.role_name)
+
+            # collect user roles
+            user_roles = {}
+            for row in conn.execute(select(users_table.c.name)):
+                user_roles[row.name] = set()
+            # direct roles
+            query = select(
+                users_table.c.name.label('user_name'),
+                roles_table.c.name.label('role_name')
+            ).select_from(
+                users_roles
+                .join(users_table,
+                      users_roles.c.user_id == users_table.c.id)
+                .join(roles_table,
+                      users_roles.c.role_id == roles_table.c.id)
+            )
+            for row in conn.execute(query):
+                user_roles[row.user_name].add(row.role_name)
+            # roles from groups
+            query = select(
+                users_table.c.name.label('user_name'),
+                groups_table.c.name.label('group_name')
+            ).select_from(
+                groups_users
+                .join(users_table,
+                      groups_users.c.user_id == users_table.c.id)
+                .join(groups_table,
+                      groups_users.c.group_id == groups_table.c.id)
+            )
+            for row in conn.execute(query):
+                user_roles[row.user_name].update(groups[row.group_name])
+
+            # collect role permissions
+            roles = {}
+            for row in conn.execute(select(roles_table.c.name)):
+                roles[row.name] = {}
+            query = select(
+                roles_table.c.name.label('role_name'),
+                resources_table.c.type,
+                resources_table.c.name,
+                parents_table.c.name.label('parent_name'),
+                permissions_table.c.write,
+                permissions_table.c.priority
+            ).select_from(
+                permissions_table
+                .join(roles_table,
+                      permissions_table.c.role_id == roles_table.c.id)
+                .join(resources_table,
+                      permissions_table.c.resource_id ==
+                      resources_table.c.id)
+                .outerjoin(parents_table,
+                           resources_table.c.parent_id == parents_table.c.id)
+            ).order_by(
+                permissions_table.c.priority.desc(), resources_table.c.name
+            )
+            for row in conn.execute(query):
+                roles[row.role_name].setdefault(row.type, []).append({
+                    'name': row.name,
+                    'parent': row.parent_name,
+                    'writable': bool(row.write),
+                    'priority': row.priority
+                })
+
+        users = {
+            # assign unique sorted roles
+            name: sorted(roles_set)
+            for name, roles_set in user_roles.items()
+        }
+
+        return {
+            'users': users,
+            'groups': groups,
+            'roles': roles
+        }
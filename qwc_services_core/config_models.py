@@ -1,25 +1,52 @@
+import hashlib
+import os
+import pickle
+
 from flask_login import UserMixin
-from sqlalchemy import MetaData
+import sqlalchemy
+from sqlalchemy import MetaData, text
 from sqlalchemy.ext.automap import automap_base
 from sqlalchemy.orm import Session, backref, relationship
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from .file_utils import atomic_write, private_dir
+
 
 class ConfigModels():
     """ConfigModels class
 
     Provide SQLAlchemy ORM models for ConfigDB queries.
+
+    If CONFIGDB_REFLECTION_CACHE_DIR is set, the reflected ConfigDB tables
+    are cached in this directory and reused as long as the schema version
+    in CONFIGDB_VERSION_TABLE (default: Alembic revision in
+    qwc_config.alembic_version) is unchanged.
+    NOTE: the cache dir is created with mode 0700 and is skipped if it is
+          not owned by the current user or accessible by others, as cache
+          files are unpickled.
     """
 
-    def __init__(self, db_engine, conn_str=None, extra_tables=[]):
+    def __init__(self, db_engine, conn_str=None, extra_tables=[],
+                 logger=None):
         """Constructor
 
         :param DatabaseEngine db_engine: Database engine with DB connections
+        :param str conn_str: Optional DB connection string
+        :param list extra_tables: Additional ConfigDB tables for models
+        :param Logger logger: Optional application logger
         """
         if conn_str:
             self.engine = db_engine.db_engine(conn_str)
         else:
             self.engine = db_engine.config_db()
+        self.logger = logger
+
+        self.reflection_cache_dir = os.environ.get(
+            'CONFIGDB_REFLECTION_CACHE_DIR'
+        )
+        self.version_table = os.environ.get(
+            'CONFIGDB_VERSION_TABLE', 'qwc_config.alembic_version'
+        )
 
         # init models
         self.base = None
@@ -53,11 +80,7 @@ class ConfigModels():
             'last_update'
         ] + extra_tables
 
-        def table_selector(table_name, meta_data):
-            return (table_name in TABLES)
-
-        metadata = MetaData()
-        metadata.reflect(self.engine, schema='qwc_config', only=table_selector)
+        metadata = self.reflect_metadata(TABLES)
         Base = automap_base(metadata=metadata)
 
         # setup user model for flask_login
@@ -207,3 +230,109 @@ class ConfigModels():
             # destroy registration requests on user delete
             cascade="save-update, merge, delete"
         )
+
+    def reflect_metadata(self, tables):
+        """Return metadata of ConfigDB tables, from reflection cache if
+        enabled and up-to-date.
+
+        :param list tables: Table names
+        """
+        if not self.reflection_cache_dir:
+            return self.reflect_tables(tables)
+
+        schema_version = self.schema_version()
+        if schema_version is None:
+            # NOTE: do not cache without schema version
+            return self.reflect_tables(tables)
+
+        try:
+            private_dir(self.reflection_cache_dir)
+        except Exception as e:
+            # NOTE: do not unpickle files others may have written
+            self.warning(
+                "Skipping ConfigDB reflection cache:\n%s" % e
+            )
+            return self.reflect_tables(tables)
+
+        path = self.reflection_cache_path(tables)
+        try:
+            with open(path, 'rb') as fh:
+                cached = pickle.load(fh)
+            if (
+                cached['schema_version'] == schema_version and
+                cached['sqlalchemy_version'] == sqlalchemy.__version__
+            ):
+                return cached['metadata']
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self.warning(
+                "Could not read ConfigDB reflection cache '%s':\n%s" %
+                (path, e)
+            )
+
+        metadata = self.reflect_tables(tables)
+
+        try:
+            atomic_write(path, [pickle.dumps({
+                'schema_version': schema_version,
+                'sqlalchemy_version': sqlalchemy.__version__,
+                'metadata': metadata
+            }, pickle.HIGHEST_PROTOCOL)], 0o600)
+        except Exception as e:
+            self.warning(
+                "Could not write ConfigDB reflection cache '%s':\n%s" %
+                (path, e)
+            )
+
+        return metadata
+
+    def reflect_tables(self, tables):
+        """Reflect ConfigDB tables and return metadata.
+
+        :param list tables: Table names
+        """
+        def table_selector(table_name, meta_data):
+            return (table_name in tables)
+
+        metadata = MetaData()
+        metadata.reflect(self.engine, schema='qwc_config', only=table_selector)
+        return metadata
+
+    def schema_version(self):
+        """Return ConfigDB schema version or None if not available."""
+        try:
+            with self.engine.connect() as conn:
+                result = conn.execute(
+                    text("SELECT version_num FROM %s" % self.version_table)
+                )
+                versions = sorted(row[0] for row in result)
+        except Exception as e:
+            self.warning("Could not read ConfigDB schema version:\n%s" % e)
+            return None
+
+        if not versions:
+            return None
+        return ','.join(versions)
+
+    def reflection_cache_path(self, tables):
+        """Return path to reflection cache file for DB and tables.
+
+        :param list tables: Table names
+        """
+        key = repr((
+            self.engine.url.render_as_string(hide_password=True),
+            sorted(tables)
+        ))
+        return os.path.join(
+            self.reflection_cache_dir,
+            'configdb_%s.pickle' % hashlib.sha1(key.encode()).hexdigest()
+        )
+
+    def warning(self, msg):
+        """Log warning if logger is set.
+
+        :param str msg: Message
+        """
+        if self.logger is not None:
+            self.logger.warning(msg)
@@ -1,27 +1,173 @@
 import os
+import threading
+import time
+import weakref
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+
+# pool options with value conversions
+POOL_OPTIONS = {
+    'pool_size': int,
+    'max_overflow': int,
+    'pool_recycle': int,
+    'pool_timeout': float,
+    'pool_pre_ping': lambda value: str(value).lower() in ('t', 'true', '1')
+}
+
+
+# DatabaseEngine instances for discarding connection pools after fork
+DATABASE_ENGINES = weakref.WeakSet()
+
+
+def after_fork_in_child():
+    """Discard connection pools of all DatabaseEngines in child process."""
+    for database_engine in list(DATABASE_ENGINES):
+        database_engine.after_fork()
+
+
+os.register_at_fork(after_in_child=after_fork_in_child)
+
+
+# setup times of new connections in current thread
+CONNECT_TIMES = threading.local()
+
+
+class StatsQueuePool(QueuePool):
+    """QueuePool recording number of checkouts and wait times
+
+    Setup times of new connections are recorded separately using the
+    dialect do_connect and pool connect events (see record_connect_times).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.connects = 0
+        self.connect_time = 0.0
+
+    def connect(self):
+        CONNECT_TIMES.total = 0.0
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            connect_time = CONNECT_TIMES.total
+            wait_time = time.perf_counter() - start - connect_time
+            with self.stats_lock:
+                self.checkouts += 1
+                self.wait_time += wait_time
+                self.max_wait_time = max(self.max_wait_time, wait_time)
+                if connect_time:
+                    self.connects += 1
+                    self.connect_time += connect_time
+
+
+def record_connect_times(engine):
+    """Record setup times of new connections for StatsQueuePool.
+
+    :param Engine engine: SQLAlchemy engine
+    """
+    @event.listens_for(engine, 'do_connect')
+    def before_connect(dialect, conn_rec, cargs, cparams):
+        CONNECT_TIMES.start = time.perf_counter()
+
+    @event.listens_for(engine, 'connect')
+    def after_connect(dbapi_connection, connection_record):
+        start = getattr(CONNECT_TIMES, 'start', None)
+        if start is not None:
+            CONNECT_TIMES.total = getattr(CONNECT_TIMES, 'total', 0.0) + (
+                time.perf_counter() - start
+            )
+            CONNECT_TIMES.start = None
 
 
 class DatabaseEngine():
-    """Helper for database connections using SQLAlchemy engines"""
+    """Helper for database connections using SQLAlchemy engines
+
+    Connection pools may be configured per connection with the options
+    pool_size, max_overflow, pool_recycle, pool_timeout and pool_pre_ping
+    (default: True), either as query parameters of the connection string
+    or for engines from env with env variables with the same prefix
+    (e.g. GEODB_POOL_SIZE for GEODB_URL).
+
+    Engines are fork-safe: pooled connections inherited from a parent
+    process (e.g. with preloaded apps in uWSGI or gunicorn) are discarded
+    without closing them and new connections are opened in the child.
+    """
 
     def __init__(self):
         """Constructor"""
+        # engines as {(<conn_str>, <pool options>): <engine>}
         self.engines = {}
+        # names for pool statistics as {(<conn_str>, <pool options>): <name>}
+        self.engine_names = {}
+        # PID of process owning the connection pools
+        self.pid = os.getpid()
+
+        DATABASE_ENGINES.add(self)
 
-    def db_engine(self, conn_str):
+    def after_fork(self):
+        """Discard connection pools inherited from parent process."""
+        for engine in list(self.engines.values()):
+            # NOTE: do not close inherited connections, which are still in
+            #       use by the parent process
+            engine.dispose(close=False)
+        self.pid = os.getpid()
+
+    def db_engine(self, conn_str, pool_options=None):
         """Return engine.
 
         :param str conn_str: DB connection string for SQLAlchemy engine
+        :param obj pool_options: Optional connection pool options, which are
+                                 overridden by any query parameters
 
         see http://docs.sqlalchemy.org/en/latest/core/engines.html#postgresql
         """
-        engine = self.engines.get(conn_str)
+        if self.pid != os.getpid():
+            # forked without fork hooks (e.g. via os.fork() from C code)
+            self.after_fork()
+
+        # NOTE: separate engines for different pool options
+        key = (conn_str, tuple(sorted((pool_options or {}).items())))
+        engine = self.engines.get(key)
         if not engine:
-            engine = create_engine(
-                conn_str, pool_pre_ping=True, echo=False)
-            self.engines[conn_str] = engine
+            url = make_url(conn_str)
+
+            # collect pool options
+            options = dict(pool_options or {})
+            for option in POOL_OPTIONS:
+                if option in url.query:
+                    options[option] = url.query[option]
+            options = {
+                option: POOL_OPTIONS[option](value)
+                for option, value in options.items()
+            }
+            url = url.difference_update_query(POOL_OPTIONS.keys())
+
+            # name for pool statistics including any pool options
+            name = url.update_query_dict({
+                option: str(value) for option, value in options.items()
+            }).render_as_string(hide_password=True)
+
+            options.setdefault('pool_pre_ping', True)
+            pool_class = url.get_dialect().get_pool_class(url)
+            if issubclass(pool_class, QueuePool):
+                options['poolclass'] = StatsQueuePool
+            else:
+                # NOTE: sizing options are only supported by QueuePool
+                options = {'pool_pre_ping': options['pool_pre_ping']}
+
+            engine = create_engine(url, echo=False, **options)
+            if isinstance(engine.pool, StatsQueuePool):
+                record_connect_times(engine)
+            self.engines[key] = engine
+            self.engine_names[key] = name
         return engine
 
     def db_engine_env(self, env_name, default=None):
@@ -34,7 +180,18 @@ class DatabaseEngine():
         if conn_str is None:
             raise Exception(
                 'db_engine_env: Environment variable %s not set' % env_name)
-        return self.db_engine(conn_str)
+
+        # collect pool options from env, e.g. GEODB_POOL_SIZE for GEODB_URL
+        prefix = env_name
+        if prefix.endswith('_URL'):
+            prefix = prefix[:-len('_URL')]
+        pool_options = {}
+        for name in POOL_OPTIONS:
+            value = os.environ.get('%s_%s' % (prefix, name.upper()))
+            if value is not None:
+                pool_options[name] = value
+
+        return self.db_engine(conn_str, pool_options)
 
     def geo_db(self):
         """Return engine for default GeoDB."""
@@ -45,3 +202,40 @@ class DatabaseEngine():
         """Return engine for default ConfigDB."""
         return self.db_engine_env('CONFIGDB_URL',
                                   'postgresql:///?service=qwc_configdb')
+
+    def pool_stats(self):
+        """Return connection pool statistics for all engines as
+        {
+            <DB URL without password and with any pool options>: {
+                size: <pool size>,
+                checked_in: <number of idle connections>,
+                checked_out: <number of connections in use>,
+                overflow: <number of overflow connections>,
+                checkouts: <total number of checkouts>,
+                wait_time: <total wait time for checkouts in s>,
+                max_wait_time: <max wait time for a checkout in s>,
+                connects: <number of new connections>,
+                connect_time: <total setup time of new connections in s>
+            }
+        }
+
+        NOTE: wait times exclude setup times of new connections
+        """
+        stats = {}
+        for key, engine in list(self.engines.items()):
+            pool = engine.pool
+            if not isinstance(pool, StatsQueuePool):
+                continue
+            stats[self.engine_names[key]] = {
+                'size': pool.size(),
+                'checked_in': pool.checkedin(),
+                'checked_out': pool.checkedout(),
+                'overflow': pool.overflow(),
+                'checkouts': pool.checkouts,
+                'wait_time': pool.wait_time,
+                'max_wait_time': pool.max_wait_time,
+                'connects': pool.connects,
+                'connect_time': pool.connect_time
+            }
+
+        return stats
@@ -0,0 +1,48 @@
+import os
+import stat
+import tempfile
+
+
+def atomic_write(path, chunks, mode=0o644):
+    """Write file via temp file in the same dir and replace it atomically,
+    so readers never see a partially written file.
+
+    :param str path: File path
+    :param list chunks: Byte strings to write
+    :param int mode: File mode
+    """
+    dirname = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            for chunk in chunks:
+                fh.write(chunk)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def private_dir(path):
+    """Create dir with mode 0700 if missing and check that it is private.
+
+    Raise Exception if path is not a directory (e.g. a symlink), not owned
+    by the current user or accessible by others, as files in private dirs
+    may be deserialized (e.g. unpickled) on read.
+
+    :param str path: Directory path
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if (
+        not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or
+        st.st_mode & 0o077
+    ):
+        raise Exception(
+            "Directory '%s' must be a directory owned by the current user "
+            "and not accessible by others (mode 0700)" % path
+        )
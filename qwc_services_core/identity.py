@@ -0,0 +1,39 @@
+"""Lightweight user identity
+"""
+
+
+class Identity:
+    """Normalized user identity
+
+    Wraps a raw identity (username or dict with username, groups and
+    optional group) and precomputes its username, groups and a hashable
+    cache key, so lookups do not need to probe the identity dict again.
+    """
+
+    __slots__ = ('identity', 'username', 'group', 'groups', 'cache_key')
+
+    def __init__(self, identity):
+        """Constructor
+
+        :param obj identity: User name or Identity dict
+        """
+        self.identity = identity
+        self.group = None
+        groups = []
+        if identity:
+            if isinstance(identity, dict):
+                self.username = identity.get('username') or None
+                groups.extend(identity.get('groups') or [])
+                self.group = identity.get('group') or None
+                if self.group:
+                    groups.append(self.group)
+            else:
+                # identity is username
+                self.username = identity
+        else:
+            self.username = None
+        self.groups = tuple(groups)
+        self.cache_key = (self.username, self.groups)
+
+    def __repr__(self):
+        return 'Identity(%r)' % (self.identity,)
@@ -0,0 +1,155 @@
+"""Directory change notifications using Linux inotify
+
+Uses the C library via ctypes, so no additional packages are required.
+"""
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+import threading
+
+
+# inotify flags (see <sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_IGNORED = 0x00008000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+    IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+)
+
+# struct inotify_event header: wd, mask, cookie, len
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+    """Watch directories for changes using Linux inotify.
+
+    Calls callback(<directory>) from a background thread for any change of
+    a file in a watched directory.
+
+    NOTE: watches are not inherited by forked processes, call reset() in the
+          child process.
+          Changes on network file systems (e.g. NFS) made on other hosts are
+          not reported.
+    """
+
+    @staticmethod
+    def available():
+        """Return whether inotify is available on this platform."""
+        return (
+            sys.platform.startswith('linux') and
+            ctypes.util.find_library('c') is not None
+        )
+
+    def __init__(self, callback, logger):
+        """Constructor
+
+        :param func callback: Function called with changed directory
+        :param Logger logger: Application logger
+        """
+        self.callback = callback
+        self.logger = logger
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Discard all watches, e.g. after fork."""
+        self.fd = None
+        # watched directories as {<watch descriptor>: <path>}
+        self.watches = {}
+        self.paths = set()
+
+    def start(self):
+        """Create inotify instance and start background thread.
+
+        NOTE: caller has to hold the lock
+        """
+        fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.fd = fd
+
+        threading.Thread(target=self.run, args=(fd,), daemon=True).start()
+
+    def add_watch(self, path):
+        """Watch directory for changes and return whether it is watched.
+
+        :param str path: Directory path
+        """
+        if path in self.paths:
+            return True
+
+        with self.lock:
+            if path in self.paths:
+                return True
+
+            try:
+                if self.fd is None:
+                    self.start()
+
+                wd = self.libc.inotify_add_watch(
+                    self.fd, os.fsencode(path), WATCH_MASK
+                )
+                if wd < 0:
+                    errno = ctypes.get_errno()
+                    raise OSError(errno, os.strerror(errno))
+            except OSError as e:
+                self.logger.warning(
+                    "Could not watch '%s' for changes:\n%s" % (path, e)
+                )
+                return False
+
+            self.watches[wd] = path
+            self.paths.add(path)
+
+        return True
+
+    def run(self, fd):
+        """Read inotify events and notify callback.
+
+        :param int fd: inotify file descriptor
+        """
+        while fd == self.fd:
+            try:
+                data = os.read(fd, 65536)
+            except OSError as e:
+                self.logger.error("Could not read inotify events:\n%s" % e)
+                return
+
+            changed = set()
+            pos = 0
+            while pos < len(data):
+                wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, pos)
+                pos += EVENT_HEADER.size + length
+
+                path = self.watches.get(wd)
+                if path is None:
+                    continue
+                changed.add(path)
+
+                if mask & IN_IGNORED:
+                    # watch removed, e.g. directory deleted
+                    with self.lock:
+                        del self.watches[wd]
+                        self.paths.discard(path)
+
+            for path in changed:
+                try:
+                    self.callback(path)
+                except Exception as e:
+                    self.logger.error(
+                        "Error in change callback for '%s':\n%s" % (path, e)
+                    )
@@ -0,0 +1,41 @@
+"""JSON parsing helper functions
+
+Uses orjson if installed, unless disabled by env JSON_BACKEND=stdlib.
+Falls back to the stdlib parser for any input rejected by orjson
+(e.g. NaN values).
+"""
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+USE_ORJSON = (
+    orjson is not None and
+    os.environ.get('JSON_BACKEND', 'orjson').lower() != 'stdlib'
+)
+
+
+def loads(data):
+    """Parse JSON document.
+
+    :param str data: JSON as str or bytes
+    """
+    if USE_ORJSON:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # retry with stdlib parser for compatibility
+            pass
+    return json.loads(data)
+
+
+def load(fh):
+    """Parse JSON document from file.
+
+    :param file fh: File object opened in text or binary mode
+    """
+    return loads(fh.read())
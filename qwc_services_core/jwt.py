@@ -1,8 +1,7 @@
 import os
 import datetime
-import json
 from flask_jwt_extended import JWTManager, unset_jwt_cookies
-from flask import redirect, request
+from flask import g, redirect, request
 from jwt.exceptions import PyJWTError
 
 
@@ -26,12 +25,12 @@ def jwt_manager(app, api=None):
     @app.after_request
     def handle_jwt_exceptions(resp):
         # If error is a JWT error, unset JWT cookies and redirect to requested URL
-        if resp.status_code == 500 and resp.content_type == "application/json":
-            data = json.loads(resp.data)
-            if "message" in data and data["message"].startswith("jwtexception:"):
-                resp = redirect(request.url)
-                unset_jwt_cookies(resp)
-                return resp
+        # NOTE: JWT errors are flagged in the request context, so the response
+        #       body is never parsed
+        if resp.status_code == 500 and g.get('jwt_exception'):
+            resp = redirect(request.url)
+            unset_jwt_cookies(resp)
+            return resp
 
         return resp
 
@@ -39,9 +38,10 @@ def jwt_manager(app, api=None):
 
         @api.errorhandler
         def restplus_error_handler(error):
-            # If error is a JWT error, prefix message with jwtexception: so that it
-            # can be recognized in handle_jwt_exceptions above
+            # If error is a JWT error, flag it so that it can be recognized
+            # in handle_jwt_exceptions above
             if isinstance(error, PyJWTError):
+                flag_jwt_exception()
                 return {"message": "jwtexception:%s" % str(error)}
 
             return {}
@@ -66,3 +66,9 @@ def jwt_manager(app, api=None):
         return redirect(request.url)
 
     return jwt
+
+
+def flag_jwt_exception():
+    """Flag JWT error for current request, so that JWT cookies are unset and
+    the requested URL is reloaded (e.g. in custom error handlers)"""
+    g.jwt_exception = True
@@ -1,21 +1,32 @@
-from copy import deepcopy
 import os
 
 from flask import json
 from werkzeug.utils import safe_join
 from .auth import get_username, get_groups
+from .identity import Identity
+from . import json_loader
+from .permissions_snapshot import PermissionsSnapshot
 
 
 class PermissionsReader():
     """PermissionsReader helper class
 
-    Read users, groups, roles and permissions for a tenant from a JSON file.
+    Read users, groups, roles and permissions for a tenant from a JSON file,
+    or from a precompiled permissions snapshot if it is up-to-date
+    (see permissions_snapshot).
     Provides helper methods for collectiong permissions.
     """
 
     # name of public role
     PUBLIC_ROLE_NAME = 'public'
 
+    # max number of memoized identity roles
+    IDENTITY_ROLES_CACHE_SIZE = 10000
+    # max number of memoized effective permissions for role combinations
+    EFFECTIVE_PERMISSIONS_CACHE_SIZE = 1000
+    # max number of memoized resource permissions per role combination
+    RESOURCE_PERMISSIONS_CACHE_SIZE = 10000
+
     @staticmethod
     def permissions_file_path(tenant):
         """Return path to permissions JSON file for a tenant.
@@ -25,15 +36,30 @@ class PermissionsReader():
         config_path = os.environ.get('CONFIG_PATH', 'config')
         return safe_join(config_path, tenant, 'permissions.json')
 
-    def __init__(self, tenant, logger):
+    @staticmethod
+    def permissions_snapshot_path(tenant):
+        """Return path to permissions snapshot file for a tenant.
+
+        :param str tenant: Tenant ID
+        """
+        config_path = os.environ.get('CONFIG_PATH', 'config')
+        return safe_join(config_path, tenant, 'permissions.snapshot')
+
+    def __init__(self, tenant, logger, use_snapshot=True):
         """Constructor
 
         :param str tenant: Tenant ID
         :param Logger logger: Application logger
+        :param bool use_snapshot: Load permissions snapshot if up-to-date
         """
         self.tenant = tenant
         self.logger = logger
+        self.use_snapshot = use_snapshot
         self.permissions = self.load_permissions()
+        # memoized identity roles as {(<username>, <groups>): <roles>}
+        self.identity_roles_cache = {}
+        # memoized effective permissions as {<roles>: EffectivePermissions}
+        self.effective_permissions_cache = {}
 
     def read_permissions(self):
         """Read permissions for a tenant from a JSON file."""
@@ -42,8 +68,8 @@ class PermissionsReader():
         permissions_path = PermissionsReader.permissions_file_path(self.tenant)
         self.logger.info("Reading permissions '%s'" % permissions_path)
         try:
-            with open(permissions_path, encoding='utf-8') as fh:
-                permissions = json.load(fh)
+            with open(permissions_path, 'rb') as fh:
+                permissions = json_loader.load(fh)
         except Exception as e:
             self.logger.error(
                 "Could not load permissions '%s':\n%s" %
@@ -54,6 +80,40 @@ class PermissionsReader():
 
         return permissions
 
+    def read_snapshot(self):
+        """Return permissions lookup from snapshot file for a tenant,
+        or None if missing or older than permissions JSON file."""
+        snapshot_path = PermissionsReader.permissions_snapshot_path(
+            self.tenant
+        )
+        try:
+            snapshot_mtime = os.path.getmtime(snapshot_path)
+        except OSError:
+            # no snapshot
+            return None
+
+        permissions_path = PermissionsReader.permissions_file_path(self.tenant)
+        try:
+            if os.path.getmtime(permissions_path) > snapshot_mtime:
+                self.logger.info(
+                    "Skipping outdated permissions snapshot '%s'" %
+                    snapshot_path
+                )
+                return None
+        except OSError:
+            # no permissions JSON file
+            pass
+
+        self.logger.info("Reading permissions snapshot '%s'" % snapshot_path)
+        try:
+            return PermissionsSnapshot(snapshot_path).lookup()
+        except Exception as e:
+            self.logger.warning(
+                "Could not load permissions snapshot '%s':\n%s" %
+                (snapshot_path, e)
+            )
+            return None
+
     def load_permissions(self):
         """Load users, groups, roles and permissions.
 
@@ -67,9 +127,21 @@ class PermissionsReader():
                 },
                 roles: {
                     <role>: <permissions{}>
+                },
+                index: {
+                    <role>: {
+                        <resource_key>: {
+                            <resource_name>: [<permission>]
+                        }
+                    }
                 }
             }
         """
+        if self.use_snapshot:
+            lookup = self.read_snapshot()
+            if lookup is not None:
+                return lookup
+
         permissions = self.read_permissions()
 
         # transform raw permissions to lookup dict
@@ -79,11 +151,13 @@ class PermissionsReader():
             'dataproducts' in permissions and 'common_resources' in permissions
         )
 
-        resources_lookup = {}
+        dataproduct_tree = None
         if is_unified:
             # create lookup for resources
+            resources_lookup = {}
             for resource in permissions.get('dataproducts', []):
                 resources_lookup[resource.get('name')] = resource
+            dataproduct_tree = DataproductTree(resources_lookup, self.logger)
 
         # collect group roles
         groups = {}
@@ -110,24 +184,52 @@ class PermissionsReader():
                 roles[role['role']] = role['permissions']
             else:
                 roles[role['role']] = self.expand_unified_permissions(
-                    role['permissions'], deepcopy(resources_lookup), permissions
+                    role['permissions'], dataproduct_tree, permissions
                 )
 
         return {
             'users': users,
             'groups': groups,
-            'roles': roles
+            'roles': roles,
+            'index': self.index_permissions(roles)
         }
 
-    def expand_unified_permissions(self, role_permissions, resources_lookup,
+    def index_permissions(self, roles):
+        """Return lookup for role permissions by resource key and name.
+
+        :param obj roles: Lookup for role permissions
+        """
+        index = {}
+        for role, role_permissions in roles.items():
+            role_index = {}
+            for resource_key, resource_permissions in role_permissions.items():
+                if not isinstance(resource_permissions, list):
+                    # skip non-list permissions
+                    continue
+                names = {}
+                for permission in resource_permissions:
+                    if isinstance(permission, dict):
+                        name = permission.get('name')
+                    else:
+                        name = permission
+                    names.setdefault(name, []).append(permission)
+                role_index[resource_key] = names
+            index[role] = role_index
+
+        return index
+
+    def expand_unified_permissions(self, role_permissions, dataproduct_tree,
                                    permissions):
         """Return full resource permissions expanded from unified permissions.
 
+        NOTE: dataproduct_tree is shared between roles and is not modified
+
         :param obj role_permissions: Unified permissions for role
-        :param obj resources_lookup: Lookup for resources with sublayers or
-                                     attributes
+        :param DataproductTree dataproduct_tree: Tree of resources with
+                                                 sublayers or attributes
         :param obj permissions: Permissions from JSON
         """
+        resources_lookup = dataproduct_tree.resources_lookup
         full_permissions = {}
 
         wms_name = permissions.get('wms_name', '')
@@ -148,20 +250,19 @@ class PermissionsReader():
         document_templates = []
         solr_facets = []
 
-        # convert all_services dict to resources list
+        # convert all_services dict to resource names list
         all_services = []
+        # writable flags from all_services as {<name>: <writable>}
+        writable = {}
         for name, resource in role_permissions.get('all_services', {}).items():
-            all_services.append({
-                'name': name
-            })
-            # copy writable flags from all_services to resources_lookup
-            if 'writable' in resource:
-                lookup = resources_lookup.get(name, {})
-                lookup['writable'] = resource['writable']
+            all_services.append(name)
+            # collect writable flags for resources in resources_lookup
+            if 'writable' in resource and name in resources_lookup:
+                writable[name] = resource['writable']
 
         # collect permitted resources for role
         role_resources = self.collect_resources(
-            all_services, resources_lookup
+            all_services, dataproduct_tree, writable
         )
 
         # expand to full QWC service permissions
@@ -192,7 +293,7 @@ class PermissionsReader():
                 data_datasets.append({
                     'name': resource['name'],
                     # NOTE: attributes without geometry column
-                    'attributes': resource['attributes'],
+                    'attributes': list(resource['attributes']),
                     'writable': resource.get('writable', False),
                     # NOTE: always readable
                     'readable': True
@@ -242,38 +343,40 @@ class PermissionsReader():
 
         return full_permissions
 
-    def collect_resources(self, parent_resources, resources_lookup):
-        """Recursively collect resources from 'all_services' and return
-        flat list of permitted resources.
+    def collect_resources(self, parent_names, dataproduct_tree, writable):
+        """Collect resources from 'all_services' and return flat list of
+        permitted resources.
 
-        :param list<obj> parent_resources: Parent resources
-        :param obj resources_lookup: Lookup for resources with sublayers or
-                                     attributes
+        :param list<str> parent_names: Parent resource names
+        :param DataproductTree dataproduct_tree: Tree of resources with
+                                                 sublayers or attributes
+        :param obj writable: Writable flags for role as {<name>: <writable>}
         """
         resources = []
+        resources_lookup = dataproduct_tree.resources_lookup
+        # names of collected resources
+        processed = set()
+
+        for parent_name in parent_names:
+            names, lookup_names = dataproduct_tree.subtree(parent_name)
+            if processed.isdisjoint(lookup_names):
+                # memoized subtree is unaffected by previous parents
+                processed.update(lookup_names)
+            else:
+                # skip any processed resources and their sublayers
+                names = dataproduct_tree.traverse(parent_name, processed)
+
+            for name in names:
+                # merge with any resource from lookup
+                resource = {'name': name}
+                lookup = resources_lookup.get(name)
+                if lookup is not None:
+                    resource.update(lookup)
+                    if name in writable:
+                        resource['writable'] = writable[name]
 
-        for resource in parent_resources:
-            # merge with any resource from lookup
-            lookup = resources_lookup.get(resource['name'], {})
-            resource.update(lookup)
-
-            if 'processed' not in lookup:
                 # add resource
                 resources.append(resource)
-                # mark lookup as processed to skip duplicates
-                lookup['processed'] = True
-            else:
-                # skip duplicates
-                continue
-
-            if 'sublayers' in resource:
-                # recursively collect sublayers
-                sub_resources = [
-                    {'name': name} for name in resource['sublayers']
-                ]
-                resources += self.collect_resources(
-                    sub_resources, resources_lookup
-                )
 
         return resources
 
@@ -284,10 +387,41 @@ class PermissionsReader():
 
         :param obj identity: User identity
         """
-        # extract username and group
-        username = get_username(identity)
-        groups = get_groups(identity)
+        # NOTE: return copy of memoized roles
+        return list(self.memoized_identity_roles(identity))
 
+    def memoized_identity_roles(self, identity):
+        """Return memoized tuple of roles for identity.
+
+        :param obj identity: User identity
+        """
+        if isinstance(identity, Identity):
+            username = identity.username
+            groups = identity.groups
+            cache_key = identity.cache_key
+        else:
+            # extract username and group
+            username = get_username(identity)
+            groups = get_groups(identity)
+            cache_key = (username, tuple(groups))
+        roles = self.identity_roles_cache.get(cache_key)
+        if roles is None:
+            roles = self.collect_identity_roles(username, groups)
+            if (
+                len(self.identity_roles_cache)
+                >= self.IDENTITY_ROLES_CACHE_SIZE
+            ):
+                self.identity_roles_cache.clear()
+            self.identity_roles_cache[cache_key] = roles
+
+        return roles
+
+    def collect_identity_roles(self, username, groups):
+        """Return unique sorted roles for username and groups.
+
+        :param str username: User name
+        :param list groups: User groups
+        """
         # add default public role
         roles = [self.PUBLIC_ROLE_NAME]
         # add any user roles
@@ -297,7 +431,28 @@ class PermissionsReader():
             roles.extend(self.permissions['groups'].get(group, []))
 
         # return unique sorted roles
-        return sorted(list(set(roles)))
+        return tuple(sorted(set(roles)))
+
+    def effective_permissions(self, identity):
+        """Return memoized EffectivePermissions for identity roles.
+
+        :param obj identity: User identity
+        """
+        roles = self.memoized_identity_roles(identity)
+        effective_permissions = self.effective_permissions_cache.get(roles)
+        if effective_permissions is None:
+            effective_permissions = EffectivePermissions(
+                roles, self.collect_permissions,
+                self.RESOURCE_PERMISSIONS_CACHE_SIZE
+            )
+            if (
+                len(self.effective_permissions_cache)
+                >= self.EFFECTIVE_PERMISSIONS_CACHE_SIZE
+            ):
+                self.effective_permissions_cache.clear()
+            self.effective_permissions_cache[roles] = effective_permissions
+
+        return effective_permissions
 
     def resource_permissions(self, resource_key, identity, resource_name=None):
         """Return collected list of resource permissions for identity roles.
@@ -306,10 +461,28 @@ class PermissionsReader():
         :param obj identity: User identity
         :param str name: Optional resource name filter
         """
+        return self.effective_permissions(identity).resource_permissions(
+            resource_key, resource_name
+        )
+
+    def collect_permissions(self, roles, resource_key, resource_name=None):
+        """Return merged list of unique resource permissions for roles.
+
+        :param list roles: Role names
+        :param str resource_key: Resource key in permissions data
+        :param str name: Optional resource name filter
+        """
         permissions = []
 
-        roles = self.identity_roles(identity)
         for role in roles:
+            if resource_name is not None:
+                # lookup indexed permissions by resource name
+                role_index = self.permissions['index'].get(role, {})
+                names = role_index.get(resource_key)
+                if names is not None:
+                    permissions.extend(names.get(resource_name, []))
+                    continue
+
             # get role permissions
             role_permissions = self.permissions['roles'].get(role, {})
             # get permissions for resource key
@@ -326,4 +499,149 @@ class PermissionsReader():
             else:
                 permissions.extend(resource_permissions)
 
-        return permissions
+        # remove duplicate permissions from multiple roles
+        unique_permissions = []
+        keys = set()
+        for permission in permissions:
+            key = json.dumps(permission, sort_keys=True)
+            if key not in keys:
+                keys.add(key)
+                unique_permissions.append(permission)
+
+        return unique_permissions
+
+
+class DataproductTree():
+    """Tree of unified permissions resources with sublayers
+
+    Provides memoized subtrees of 'all_services' resources, so roles sharing
+    large layer groups reuse the expanded resource names. Resources are
+    visited only once per traversal, so any cycles in sublayers end there
+    and are logged.
+    """
+
+    def __init__(self, resources_lookup, logger):
+        """Constructor
+
+        :param obj resources_lookup: Lookup for resources with sublayers or
+                                     attributes
+        :param Logger logger: Application logger
+        """
+        self.resources_lookup = resources_lookup
+        self.logger = logger
+        # memoized subtrees as {<name>: ([<name>], {<name in lookup>})}
+        self.subtrees = {}
+
+    def resource_sublayers(self, name):
+        """Return sublayer names from resources lookup.
+
+        :param str name: Resource name
+        """
+        return self.resources_lookup.get(name, {}).get('sublayers') or []
+
+    def subtree(self, name):
+        """Return memoized names of resource and all its sublayers in
+        depth-first order, and the set of these names in resources lookup.
+
+        :param str name: Resource name
+        """
+        subtree = self.subtrees.get(name)
+        if subtree is None:
+            visited = set()
+            names = self.traverse(name, visited, log_cycles=True)
+            subtree = (names, frozenset(visited))
+            self.subtrees[name] = subtree
+
+        return subtree
+
+    def traverse(self, name, visited, log_cycles=False):
+        """Return names of resource and all its sublayers in depth-first
+        order, skipping any visited resources and their sublayers.
+
+        NOTE: resources from lookup are included only once and are added to
+              visited, any other names may be repeated
+
+        :param str name: Resource name
+        :param set visited: Names of visited resources in lookup
+        :param bool log_cycles: Log any cyclic sublayers
+        """
+        names = []
+        # names of resources in current path
+        path = set()
+
+        # iterative depth-first traversal
+        stack = [(None, iter([name]))]
+        while stack:
+            parent_name, sublayers = stack[-1]
+            sub_name = next(sublayers, None)
+            if sub_name is None:
+                # all sublayers visited
+                stack.pop()
+                path.discard(parent_name)
+                continue
+
+            if sub_name in self.resources_lookup:
+                if sub_name in visited:
+                    if log_cycles and sub_name in path:
+                        self.logger.warning(
+                            "Skipping cyclic sublayer '%s' of '%s' "
+                            "in permissions" % (sub_name, parent_name)
+                        )
+                    # skip duplicates and their sublayers
+                    continue
+                visited.add(sub_name)
+                path.add(sub_name)
+                stack.append(
+                    (sub_name, iter(self.resource_sublayers(sub_name)))
+                )
+
+            names.append(sub_name)
+
+        return names
+
+
+class EffectivePermissions():
+    """Merged resource permissions for a combination of roles
+
+    Permissions are collected for each resource key and name on first access
+    and memoized, except for empty permissions of named resources (e.g.
+    unknown names from request URLs). Instances are owned by a
+    PermissionsReader and discarded together with it.
+    """
+
+    def __init__(self, roles, collect_permissions, max_entries):
+        """Constructor
+
+        :param tuple roles: Role names
+        :param func collect_permissions: Function returning merged permissions
+                                         for (roles, resource_key,
+                                         resource_name)
+        :param int max_entries: Max number of memoized permissions
+        """
+        self.roles = roles
+        self.collect_permissions = collect_permissions
+        self.max_entries = max_entries
+        # memoized permissions as {(<resource_key>, <name>): [<permission>]}
+        self.permissions = {}
+
+    def resource_permissions(self, resource_key, resource_name=None):
+        """Return list of resource permissions.
+
+        :param str resource_key: Resource key in permissions data
+        :param str name: Optional resource name filter
+        """
+        key = (resource_key, resource_name)
+        permissions = self.permissions.get(key)
+        if permissions is None:
+            permissions = self.collect_permissions(
+                self.roles, resource_key, resource_name
+            )
+            if not permissions and resource_name is not None:
+                # NOTE: do not memoize unknown resource names
+                return permissions
+            if len(self.permissions) >= self.max_entries:
+                self.permissions.clear()
+            self.permissions[key] = permissions
+
+        # NOTE: return copy of memoized list
+        return list(permissions)
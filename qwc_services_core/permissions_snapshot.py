@@ -0,0 +1,341 @@
+"""Precompiled binary snapshot of expanded permissions
+
+A snapshot stores the lookup dict of PermissionsReader.load_permissions()
+in a compact binary file, which is mapped read-only with mmap, so all
+workers on a host share the same pages and do not need to parse and expand
+permissions.json on startup.
+
+File layout (all integers are little-endian uint32):
+
+    header:  <magic> <strings offset> <root table offset>
+    strings: <count> <offsets[count + 1]> <UTF-8 data>
+             (interned strings, sorted by their UTF-8 bytes)
+    table:   <count> <entries[count]>
+             (entries sorted by key as (<key string>, <kind>, <offset>,
+              <length>), pointing to a nested table or a JSON value)
+
+Usage:
+
+    python -m qwc_services_core.permissions_snapshot <tenant> [<output>]
+"""
+from collections.abc import Mapping
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+
+from . import json_loader
+from .file_utils import atomic_write
+
+
+MAGIC = b'QWCPERM1'
+HEADER = struct.Struct('<8sII')
+UINT32 = struct.Struct('<I')
+ENTRY = struct.Struct('<IIII')
+
+# entry kinds
+KIND_VALUE = 0
+KIND_TABLE = 1
+
+
+class PermissionsSnapshot():
+    """Read-only memory-mapped permissions snapshot"""
+
+    def __init__(self, path):
+        """Constructor
+
+        :param str path: Path to snapshot file
+        """
+        with open(path, 'rb') as fh:
+            self.mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, strings_offset, root_offset = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise Exception("Invalid permissions snapshot '%s'" % path)
+
+        self.strings_count = UINT32.unpack_from(self.mm, strings_offset)[0]
+        self.string_offsets_offset = strings_offset + UINT32.size
+        self.root = SnapshotTable(self, root_offset)
+
+    def lookup(self):
+        """Return permissions lookup as in PermissionsReader.load_permissions
+        with read-only tables for users, groups, roles and index."""
+        return {
+            'users': self.root['users'],
+            'groups': self.root['groups'],
+            'roles': self.root['roles'],
+            'index': self.root['index']
+        }
+
+    def string_range(self, idx):
+        """Return (<start>, <end>) offsets of interned string.
+
+        :param int idx: String index
+        """
+        return struct.unpack_from(
+            '<II', self.mm, self.string_offsets_offset + idx * UINT32.size
+        )
+
+    def string(self, idx):
+        """Return interned string.
+
+        :param int idx: String index
+        """
+        start, end = self.string_range(idx)
+        return self.mm[start:end].decode('utf-8')
+
+    def string_index(self, value):
+        """Return index of interned string or None if not present.
+
+        :param str value: String
+        """
+        if not isinstance(value, str):
+            return None
+        data = value.encode('utf-8')
+
+        # binary search in sorted strings
+        low = 0
+        high = self.strings_count
+        while low < high:
+            mid = (low + high) // 2
+            start, end = self.string_range(mid)
+            candidate = self.mm[start:end]
+            if candidate < data:
+                low = mid + 1
+            elif candidate > data:
+                high = mid
+            else:
+                return mid
+
+        return None
+
+
+class SnapshotTable(Mapping):
+    """Read-only mapping backed by a table in a PermissionsSnapshot
+
+    Values are decoded on access.
+    """
+
+    def __init__(self, snapshot, offset):
+        """Constructor
+
+        :param PermissionsSnapshot snapshot: Snapshot
+        :param int offset: Table offset
+        """
+        self.snapshot = snapshot
+        self.count = UINT32.unpack_from(snapshot.mm, offset)[0]
+        self.entries_offset = offset + UINT32.size
+
+    def entry(self, pos):
+        """Return (<key index>, <kind>, <offset>, <length>) of entry.
+
+        :param int pos: Entry position
+        """
+        return ENTRY.unpack_from(
+            self.snapshot.mm, self.entries_offset + pos * ENTRY.size
+        )
+
+    def value(self, kind, offset, length):
+        """Return decoded value of entry.
+
+        :param int kind: Entry kind
+        :param int offset: Value offset
+        :param int length: Value length
+        """
+        if kind == KIND_TABLE:
+            return SnapshotTable(self.snapshot, offset)
+        else:
+            return json_loader.loads(self.snapshot.mm[offset:offset + length])
+
+    def __getitem__(self, key):
+        key_idx = self.snapshot.string_index(key)
+        if key_idx is not None:
+            # binary search in entries sorted by key index
+            low = 0
+            high = self.count
+            while low < high:
+                mid = (low + high) // 2
+                entry_key, kind, offset, length = self.entry(mid)
+                if entry_key < key_idx:
+                    low = mid + 1
+                elif entry_key > key_idx:
+                    high = mid
+                else:
+                    return self.value(kind, offset, length)
+
+        raise KeyError(key)
+
+    def __iter__(self):
+        for pos in range(self.count):
+            yield self.snapshot.string(self.entry(pos)[0])
+
+    def __len__(self):
+        return self.count
+
+    def items(self):
+        for pos in range(self.count):
+            key_idx, kind, offset, length = self.entry(pos)
+            yield (
+                self.snapshot.string(key_idx),
+                self.value(kind, offset, length)
+            )
+
+
+def write_permissions_snapshot(permissions, path):
+    """Write permissions lookup to snapshot file.
+
+    The file is replaced atomically, so any mapped previous snapshot
+    remains valid.
+
+    :param obj permissions: Permissions lookup from
+                            PermissionsReader.load_permissions
+    :param str path: Path to snapshot file
+    """
+    root = {
+        'users': permissions['users'],
+        'groups': permissions['groups'],
+        'roles': {
+            # nested table for resource keys
+            role: dict(role_permissions)
+            for role, role_permissions in permissions['roles'].items()
+        },
+        'index': {
+            role: {
+                resource_key: {
+                    # NOTE: skip non-string names, which are not looked up
+                    name: name_permissions
+                    for name, name_permissions in names.items()
+                    if isinstance(name, str)
+                }
+                for resource_key, names in role_index.items()
+            }
+            for role, role_index in permissions['index'].items()
+        }
+    }
+    # nesting depth of tables below root keys
+    table_depths = {'users': 1, 'groups': 1, 'roles': 2, 'index': 3}
+
+    # collect interned strings
+    strings = set(root.keys())
+
+    def collect_keys(table, depth):
+        for key, value in table.items():
+            strings.add(key)
+            if depth > 1:
+                collect_keys(value, depth - 1)
+
+    for key, depth in table_depths.items():
+        collect_keys(root[key], depth)
+
+    encoded = sorted(s.encode('utf-8') for s in strings)
+    string_indexes = {
+        data.decode('utf-8'): idx for idx, data in enumerate(encoded)
+    }
+
+    # strings section
+    strings_offset = HEADER.size
+    data_offset = strings_offset + UINT32.size * (len(encoded) + 2)
+    offsets = []
+    for data in encoded:
+        offsets.append(data_offset)
+        data_offset += len(data)
+    offsets.append(data_offset)
+
+    chunks = [
+        UINT32.pack(len(encoded)),
+        struct.pack('<%dI' % len(offsets), *offsets)
+    ] + encoded
+    size = data_offset
+
+    def append(data):
+        nonlocal size
+        offset = size
+        chunks.append(data)
+        size += len(data)
+        return offset
+
+    # offsets of written JSON values as {<data>: <offset>}
+    values = {}
+
+    def write_table(table, depth):
+        entries = []
+        for key, value in table.items():
+            if depth > 1:
+                offset = write_table(value, depth - 1)
+                entries.append(
+                    (string_indexes[key], KIND_TABLE, offset, 0)
+                )
+            else:
+                data = json_dumps(value)
+                # NOTE: store identical values only once
+                offset = values.get(data)
+                if offset is None:
+                    offset = append(data)
+                    values[data] = offset
+                entries.append(
+                    (string_indexes[key], KIND_VALUE, offset, len(data))
+                )
+
+        entries.sort()
+        return append(
+            UINT32.pack(len(entries)) +
+            b''.join(ENTRY.pack(*entry) for entry in entries)
+        )
+
+    root_table = {}
+    for key, depth in table_depths.items():
+        root_table[key] = write_table(root[key], depth)
+    root_entries = sorted(
+        (string_indexes[key], KIND_TABLE, offset, 0)
+        for key, offset in root_table.items()
+    )
+    root_offset = append(
+        UINT32.pack(len(root_entries)) +
+        b''.join(ENTRY.pack(*entry) for entry in root_entries)
+    )
+
+    atomic_write(
+        path, [HEADER.pack(MAGIC, strings_offset, root_offset)] + chunks
+    )
+
+
+def json_dumps(value):
+    """Return compact UTF-8 encoded JSON for value.
+
+    :param obj value: Value
+    """
+    if json_loader.USE_ORJSON:
+        return json_loader.orjson.dumps(value)
+    else:
+        return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+def main(args):
+    """Compile permissions snapshot for a tenant.
+
+    :param list args: Command line arguments [<tenant>, <output>]
+    """
+    from .permissions_reader import PermissionsReader
+
+    if len(args) < 1:
+        print(__doc__.split('Usage:')[1].strip())
+        return 1
+
+    tenant = args[0]
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger('permissions_snapshot')
+
+    reader = PermissionsReader(tenant, logger, use_snapshot=False)
+    if len(args) > 1:
+        path = args[1]
+    else:
+        path = PermissionsReader.permissions_snapshot_path(tenant)
+    write_permissions_snapshot(reader.permissions, path)
+    logger.info("Wrote permissions snapshot '%s'" % path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
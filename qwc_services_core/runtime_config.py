@@ -1,11 +1,39 @@
+from collections.abc import Mapping
+import copy
+import json
+import logging
+import mmap
 import os
 import re
-from flask import json
+import sys
+import threading
+from types import MappingProxyType
 from werkzeug.utils import safe_join
+from . import json_loader
+from .file_utils import atomic_write
 
 
 class RuntimeConfig:
     '''Runtime configuration helper class
+
+    Config values with any env overrides are resolved once when reading the
+    config.
+
+    If RUNTIME_CONFIG_CACHE is set, parsed configs are cached per process
+    and shared by all RuntimeConfig instances until the config file changes.
+    NOTE: shared configs must not be modified.
+
+    If RUNTIME_CONFIG_LAZY is set and an up-to-date split config file
+    <service>Config.split exists, only the top-level config is parsed on
+    read and each resource is parsed on first access. Split config files
+    are generated with:
+
+        python -m qwc_services_core.runtime_config <service> <tenant>
+
+    NOTE: lazy resources are a read-only Mapping, not a dict. copy.deepcopy
+          and pickle return a plain dict with all resources parsed, while
+          json.dumps requires converting them first, e.g. with
+          dict(config.resources()).
     '''
 
     @staticmethod
@@ -19,10 +47,26 @@ class RuntimeConfig:
         filename = '%sConfig.json' % service
         return safe_join(config_path, tenant, filename)
 
+    @staticmethod
+    def split_config_file_path(service, tenant):
+        """Return path to split config file for a tenant.
+
+        :param str service: Service name
+        :param str tenant: Tenant ID
+        """
+        config_path = os.environ.get('CONFIG_PATH', 'config')
+        filename = '%sConfig.split' % service
+        return safe_join(config_path, tenant, filename)
+
     def __init__(self, service, logger):
         self.service = service
         self.logger = logger
         self.config = None
+        # resolved config values with env overrides
+        self.resolved = MappingProxyType({})
+        # memoized values for names not in config
+        #   as {(<name>, <type>, <default>): <value>}
+        self.resolved_defaults = {}
 
     def read_config(self, tenant):
         """Read service config for a tenant from a JSON file.
@@ -32,29 +76,154 @@ class RuntimeConfig:
         runtime_config_path = RuntimeConfig.config_file_path(
             self.service, tenant
         )
+        if CONFIG_LAZY_ENABLED:
+            split_config = self.read_split_config(tenant)
+            if split_config is not None:
+                self.config = split_config
+                self.resolved = self.resolve_config()
+                self.resolved_defaults = {}
+                return self
+
         self.logger.info(
             "Reading runtime config '%s'" % runtime_config_path
         )
         try:
             with open(runtime_config_path, encoding='utf-8') as fh:
-                data = fh.read()
-                # Replace env variables
-                dataout = ENVVAR_PATTERN.sub(envrepl, data)
-                self.config = json.loads(dataout)
+                config = None
+                if CONFIG_CACHE_ENABLED:
+                    # lookup config by file path and state
+                    st = os.fstat(fh.fileno())
+                    cache_key = (st.st_mtime_ns, st.st_size, st.st_ino)
+                    cached = CONFIG_CACHE.get(runtime_config_path)
+                    if cached is not None and cached[0] == cache_key:
+                        config = cached[1]
+
+                if config is None:
+                    data = fh.read()
+                    # Replace env variables
+                    dataout = ENVVAR_PATTERN.sub(envrepl, data)
+                    config = json_loader.loads(dataout)
+                    if CONFIG_CACHE_ENABLED:
+                        with CONFIG_CACHE_LOCK:
+                            CONFIG_CACHE[runtime_config_path] = (
+                                cache_key, config
+                            )
+
+                self.config = config
         except Exception as e:
             self.logger.error(
                 "Could not load runtime config '%s':\n%s" %
                 (runtime_config_path, e)
             )
             self.config = {}
+
+        self.resolved = self.resolve_config()
+        self.resolved_defaults = {}
         return self
 
     def tenant_config(self, tenant):
         return self.read_config(tenant)
 
+    def read_split_config(self, tenant):
+        """Return config with lazily parsed resources from split config file,
+        or None if missing or older than config file.
+
+        :param str tenant: Tenant ID
+        """
+        runtime_config_path = RuntimeConfig.config_file_path(
+            self.service, tenant
+        )
+        split_config_path = RuntimeConfig.split_config_file_path(
+            self.service, tenant
+        )
+        try:
+            if (
+                os.path.getmtime(runtime_config_path) >
+                os.path.getmtime(split_config_path)
+            ):
+                self.logger.info(
+                    "Skipping outdated split config '%s'" % split_config_path
+                )
+                return None
+        except (OSError, TypeError):
+            # no split config
+            return None
+
+        self.logger.info("Reading split config '%s'" % split_config_path)
+        try:
+            with open(split_config_path, 'rb') as fh:
+                mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            # header with top-level config and resources index
+            header_end = mm.find(b'\n')
+            header = json_loader.loads(
+                ENVVAR_PATTERN.sub(envrepl, mm[:header_end].decode('utf-8'))
+            )
+            config = header['config']
+            if header['index'] is not None:
+                config['resources'] = LazyResources(
+                    mm, header_end + 1, header['index']
+                )
+            return config
+        except Exception as e:
+            self.logger.warning(
+                "Could not load split config '%s':\n%s" %
+                (split_config_path, e)
+            )
+            return None
+
+    @staticmethod
+    def preload(service, tenants, logger):
+        """Read service configs for tenants into the process-wide cache.
+
+        Call before forking worker processes (e.g. uWSGI without lazy-apps),
+        so workers share the parsed configs copy-on-write. Consider calling
+        gc.freeze() afterwards to keep these pages shared.
+        NOTE: requires RUNTIME_CONFIG_CACHE
+
+        :param str service: Service name
+        :param list tenants: Tenant IDs
+        :param Logger logger: Application logger
+        """
+        if not CONFIG_CACHE_ENABLED:
+            logger.warning(
+                "RuntimeConfig.preload requires RUNTIME_CONFIG_CACHE"
+            )
+            return
+
+        for tenant in tenants:
+            RuntimeConfig(service, logger).read_config(tenant)
+
+    def resolve_config(self):
+        """Return read-only lookup of config values with env overrides."""
+        resolved = {}
+        for name, val in (self.config.get('config') or {}).items():
+            resolved[name] = self.resolve(name, val)
+
+        return MappingProxyType(resolved)
+
     def get(self, name, default=None):
-        val = self.config.get('config', {}).get(name, default)
-        # Optional override from env var
+        if name in self.resolved:
+            return self.resolved[name]
+
+        try:
+            # NOTE: include type, as e.g. 1 and True are equal keys
+            key = (name, type(default), default)
+            if key in self.resolved_defaults:
+                return self.resolved_defaults[key]
+        except TypeError:
+            # default is not hashable
+            return self.resolve(name, default)
+
+        val = self.resolve(name, default)
+        self.resolved_defaults[key] = val
+        return val
+
+    def resolve(self, name, val):
+        """Return config value with optional override from env var.
+
+        :param str name: Config name
+        :param obj val: Config value or default
+        """
         envval = os.environ.get(name.upper())
         if envval is not None:
             # Convert from string
@@ -63,7 +232,7 @@ class RuntimeConfig:
                     # unkown type --> no conversion
                     val = envval
                 elif type(val) in (list, dict):
-                    val = json.loads(envval)
+                    val = json_loader.loads(envval)
                 elif type(val) is bool:
                     # convert string to boolean
                     # cf. deprecated distutils.util.strtobool
@@ -101,6 +270,107 @@ class RuntimeConfig:
         return self.config.get('resources', {}).get(name)
 
 
+class LazyResources(Mapping):
+    """Read-only mapping of config resources parsed on first access
+
+    Copies (copy.copy, copy.deepcopy, pickle) are plain dicts with all
+    resources parsed, as the underlying split config data is memory-mapped.
+    """
+
+    def __init__(self, data, offset, index):
+        """Constructor
+
+        :param bytes data: Split config data
+        :param int offset: Offset of resources section
+        :param obj index: Resources index as {<name>: [<offset>, <length>]}
+        """
+        self.data = data
+        self.offset = offset
+        self.index = index
+        # parsed resources as {<name>: <resource>}
+        self.parsed = {}
+
+    def __getitem__(self, name):
+        if name in self.parsed:
+            return self.parsed[name]
+
+        offset, length = self.index[name]
+        start = self.offset + offset
+        resource = json_loader.loads(ENVVAR_PATTERN.sub(
+            envrepl, self.data[start:start + length].decode('utf-8')
+        ))
+        self.parsed[name] = resource
+        return resource
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def copy(self):
+        """Return dict with all resources parsed."""
+        return {name: self[name] for name in self.index}
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(self.copy(), memo)
+
+    def __reduce__(self):
+        return (dict, (self.copy(),))
+
+
+def write_split_config(config_path, split_config_path, logger=None):
+    """Split config file into top-level config and separate resources.
+
+    :param str config_path: Path to config file
+    :param str split_config_path: Path to split config file
+    :param Logger logger: Optional logger for warnings
+    """
+    if logger is None:
+        logger = logging.getLogger(__name__)
+
+    with open(config_path, encoding='utf-8') as fh:
+        data = fh.read()
+    try:
+        # NOTE: keep $$VAR$$ placeholders for replacement on read
+        config = json.loads(data)
+    except ValueError:
+        # placeholders outside of strings
+        logger.warning(
+            "Replacing env variables in split config '%s'" %
+            split_config_path
+        )
+        config = json.loads(ENVVAR_PATTERN.sub(envrepl, data))
+
+    resources = config.pop('resources', None)
+    index = None if resources is None else {}
+    chunks = []
+    offset = 0
+    for name, resource in (resources or {}).items():
+        chunk = json.dumps(resource, separators=(',', ':')).encode('utf-8')
+        index[name] = [offset, len(chunk)]
+        chunks.append(chunk)
+        offset += len(chunk)
+
+    # NOTE: compact JSON header does not contain any newlines
+    header = json.dumps(
+        {'config': config, 'index': index}, separators=(',', ':')
+    ).encode('utf-8')
+
+    atomic_write(split_config_path, [header + b'\n'] + chunks)
+
+
+# lazy resources from split config files
+CONFIG_LAZY_ENABLED = os.environ.get('RUNTIME_CONFIG_LAZY', 'False') \
+    .lower() in ('t', 'true')
+
+# process-wide cache of parsed configs
+#   as {<path>: ((<mtime>, <size>, <inode>), <config>)}
+CONFIG_CACHE_ENABLED = os.environ.get('RUNTIME_CONFIG_CACHE', 'False') \
+    .lower() in ('t', 'true')
+CONFIG_CACHE = {}
+CONFIG_CACHE_LOCK = threading.Lock()
+
 ENVVAR_PATTERN = re.compile(r'\$\$(\w+)\$\$')
 
 
@@ -108,3 +378,18 @@ def envrepl(match):
     name = match.group(1)
     val = os.environ.get(name, '')
     return val
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print("python -m qwc_services_core.runtime_config <service> <tenant>")
+        sys.exit(1)
+    service, tenant = sys.argv[1:3]
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger('runtime_config')
+    split_config_path = RuntimeConfig.split_config_file_path(service, tenant)
+    write_split_config(
+        RuntimeConfig.config_file_path(service, tenant), split_config_path,
+        logger
+    )
+    logger.info("Wrote split config '%s'" % split_config_path)
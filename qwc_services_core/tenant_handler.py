@@ -1,9 +1,15 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import os
 import re
+import stat
+import threading
+import time
+import weakref
 from flask import request
 from flask.sessions import SecureCookieSessionInterface
 
+from .inotify import InotifyWatcher
 from .permissions_reader import PermissionsReader
 from .runtime_config import RuntimeConfig
 
@@ -11,6 +17,19 @@ from .runtime_config import RuntimeConfig
 DEFAULT_TENANT = 'default'
 
 
+# TenantHandler instances for resetting background threads after fork
+TENANT_HANDLERS = weakref.WeakSet()
+
+
+def after_fork_in_child():
+    """Reset background threads of all TenantHandlers in child process."""
+    for tenant_handler in list(TENANT_HANDLERS):
+        tenant_handler.after_fork()
+
+
+os.register_at_fork(after_in_child=after_fork_in_child)
+
+
 class TenantHandlerBase:
     """Tenant handler base class"""
 
@@ -70,7 +89,28 @@ class TenantHandlerBase:
 
 
 class TenantHandler(TenantHandlerBase):
-    """Tenant handler with configuraton cache"""
+    """Tenant handler with configuraton cache
+
+    Config and permission files of cached handlers are checked for changes
+    at most every CONFIG_CHECK_INTERVAL seconds (default: 0, i.e. on every
+    request).
+
+    If CONFIG_INOTIFY is set on Linux, tenant config dirs are watched with
+    inotify instead, so files are only checked again after a change.
+
+    If CONFIG_BACKGROUND_RELOAD is set, handlers registered with a factory
+    are checked for config changes by a background thread (or on inotify
+    events) and rebuilt off the request path. Requests are served by the
+    previous handler until the new handler is ready.
+
+    The number of cached tenants per handler name may be limited by
+    HANDLER_CACHE_MAX_TENANTS, in which case least recently used handlers
+    are evicted. Handlers unused for HANDLER_CACHE_IDLE_TIMEOUT seconds are
+    evicted as well. See handler_stats() for cache statistics.
+
+    Handlers may be pre-loaded at startup with prewarm() for tenants listed
+    in PREWARM_TENANTS. Use is_ready() for readiness checks.
+    """
 
     def __init__(self, logger):
         """Constructor
@@ -81,6 +121,55 @@ class TenantHandler(TenantHandlerBase):
         self.logger = logger
         self.handler_cache = {}  # handler_cache[handler_name][tenant]
 
+        # min interval in seconds between config file checks
+        self.config_check_interval = float(
+            os.environ.get('CONFIG_CHECK_INTERVAL', 0)
+        )
+
+        # optional inotify watcher for tenant config dirs
+        self.watcher = None
+        # watched tenant config dirs as {<path>: <tenant>}
+        self.watched_dirs = {}
+        # number of notified config changes as {<tenant>: <count>}
+        self.config_changes = {}
+        use_inotify = os.environ.get('CONFIG_INOTIFY', 'False') \
+            .lower() in ('t', 'true')
+        if use_inotify:
+            if InotifyWatcher.available():
+                self.watcher = InotifyWatcher(
+                    self.config_dir_changed, logger
+                )
+            else:
+                self.logger.warning(
+                    "CONFIG_INOTIFY is not supported on this platform"
+                )
+
+        # rebuild handlers with factory in background on config changes
+        self.background_reload = os.environ.get(
+            'CONFIG_BACKGROUND_RELOAD', 'False'
+        ).lower() in ('t', 'true')
+        self.poll_thread = None
+        # handlers currently rebuilt as {(<handler_name>, <tenant>)}
+        self.reloading = set()
+        self.reload_lock = threading.Lock()
+
+        TENANT_HANDLERS.add(self)
+
+        # max number of cached tenants per handler name (0 for unlimited)
+        self.max_tenants = int(os.environ.get('HANDLER_CACHE_MAX_TENANTS', 0))
+        # timeout in seconds for removing unused handlers (0 for no timeout)
+        self.idle_timeout = float(
+            os.environ.get('HANDLER_CACHE_IDLE_TIMEOUT', 0)
+        )
+        self.next_idle_sweep = time.time() + self.idle_timeout
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+        # number of pending prewarm() calls
+        self.prewarming = 0
+        self.prewarm_lock = threading.Lock()
+        self.ready = threading.Event()
+        self.ready.set()
+
     def handler(self, service_name, handler_name, tenant):
         """Get service handler for tenant.
 
@@ -91,34 +180,411 @@ class TenantHandler(TenantHandlerBase):
         :param str handler_name: Handler name
         :param str tenant: Tenant ID
         """
+        now = time.time()
+        if self.idle_timeout and now >= self.next_idle_sweep:
+            self.evict_idle_handlers(now)
+
         handlers = self.handler_cache.get(handler_name)
         if handlers:
             handler = handlers.get(tenant)
             if handler:
-                # check for config updates
-                last_update = self.last_config_update(service_name, tenant)
-                if last_update and last_update < handler.get('last_update'):
-                    # cache is up-to-date
+                if self.lookup_handler(
+                    service_name, handler_name, tenant, handler, now
+                ):
+                    self.stats['hits'] += 1
+                    handler['last_access'] = now
                     return handler.get('handler')
                 else:
                     # config has changed, remove handler from cache
                     if tenant in handlers:
                         del handlers[tenant]
 
+        self.stats['misses'] += 1
         return None
 
-    def register_handler(self, handler_name, tenant, handler):
-        """Register service handler for tenant"""
+    def lookup_handler(self, service_name, handler_name, tenant, handler,
+                       now):
+        """Return whether cached handler is up-to-date.
+
+        :param str service_name: Service name
+        :param str handler_name: Handler name
+        :param str tenant: Tenant ID
+        :param obj handler: Handler cache entry
+        :param float now: Current timestamp
+        """
+        if handler['background']:
+            if handler['next_check'] == 0:
+                # start watching for config changes
+                handler['next_check'] = float('inf')
+                if not self.watch_tenant(tenant):
+                    self.start_polling()
+                self.check_background_handler(handler_name, tenant, handler)
+            # config changes are handled by background reload
+            return True
+
+        if now < handler['next_check']:
+            # skip check within check interval
+            return True
+
+        # NOTE: watch before checking to not miss any changes
+        watched = self.watch_tenant(tenant)
+        changes = self.config_changes.get(tenant, 0)
+
+        # check for config updates
+        last_update = self.last_config_update(service_name, tenant)
+        if last_update and last_update < handler.get('last_update'):
+            # cache is up-to-date
+            if watched:
+                # skip checks until notified about changes
+                handler['next_check'] = float('inf')
+                if self.config_changes.get(tenant, 0) != changes:
+                    # notified about changes since check
+                    handler['next_check'] = 0
+            else:
+                handler['next_check'] = now + self.config_check_interval
+            return True
+
+        return False
+
+    def register_handler(self, handler_name, tenant, handler,
+                         service_name=None, factory=None,
+                         last_update=None):
+        """Register service handler for tenant
+
+        :param str handler_name: Handler name
+        :param str tenant: Tenant ID
+        :param obj handler: Service handler
+        :param str service_name: Service name for background reload
+                                 (used for detecting config changes)
+        :param func factory: Function without arguments returning a new
+                             service handler for background reload
+        :param datetime last_update: Time of reading the handler config
+                                     (default: now)
+        """
         handlers = self.handler_cache.get(handler_name)
         if handlers is None:
             handlers = {}
             self.handler_cache[handler_name] = handlers
+
+        now = time.time()
+        if self.max_tenants and tenant not in handlers:
+            while len(handlers) >= self.max_tenants:
+                # evict least recently used handler
+                lru_tenant, lru_handler = min(
+                    list(handlers.items()),
+                    key=lambda item: item[1]['last_access']
+                )
+                self.evict_handler(handler_name, lru_tenant)
+
+        background = bool(
+            self.background_reload and service_name and factory
+        )
         handlers[tenant] = {
             'handler': handler,
-            'last_update': datetime.utcnow()
+            'last_update': last_update or datetime.utcnow(),
+            # NOTE: check for config updates on first lookup
+            'next_check': 0,
+            'service_name': service_name,
+            'factory': factory,
+            'background': background,
+            'last_access': now
         }
         return handler
 
+    def evict_handler(self, handler_name, tenant):
+        """Remove service handler for tenant from cache.
+
+        :param str handler_name: Handler name
+        :param str tenant: Tenant ID
+        """
+        handlers = self.handler_cache.get(handler_name, {})
+        if handlers.pop(tenant, None) is not None:
+            self.stats['evictions'] += 1
+            self.logger.debug(
+                "Evicted handler '%s' for tenant '%s'" % (handler_name, tenant)
+            )
+
+    def evict_idle_handlers(self, now):
+        """Remove all service handlers unused for longer than idle timeout.
+
+        :param float now: Current timestamp
+        """
+        self.next_idle_sweep = now + self.idle_timeout
+        for handler_name, handlers in list(self.handler_cache.items()):
+            for tenant, handler in list(handlers.items()):
+                if now - handler['last_access'] > self.idle_timeout:
+                    self.evict_handler(handler_name, tenant)
+
+    def handler_stats(self):
+        """Return handler cache statistics as
+        {
+            hits: <number of cache hits>,
+            misses: <number of cache misses>,
+            evictions: <number of evicted handlers>,
+            tenants: {
+                <handler_name>: <number of cached tenants>
+            }
+        }"""
+        stats = dict(self.stats)
+        stats['tenants'] = {
+            handler_name: len(handlers)
+            for handler_name, handlers in self.handler_cache.items()
+        }
+        return stats
+
+    def reload_handler(self, handler_name, tenant):
+        """Rebuild service handler for tenant in background thread and
+        replace it when ready.
+
+        :param str handler_name: Handler name
+        :param str tenant: Tenant ID
+        """
+        key = (handler_name, tenant)
+        with self.reload_lock:
+            if key in self.reloading:
+                # reload already in progress
+                return
+            self.reloading.add(key)
+
+        threading.Thread(
+            target=self.run_reload, args=(handler_name, tenant), daemon=True
+        ).start()
+
+    def run_reload(self, handler_name, tenant):
+        """Rebuild and replace service handler for tenant.
+
+        :param str handler_name: Handler name
+        :param str tenant: Tenant ID
+        """
+        try:
+            entry = self.handler_cache[handler_name][tenant]
+            self.logger.info(
+                "Reloading handler '%s' for tenant '%s'" %
+                (handler_name, tenant)
+            )
+            # NOTE: take timestamp before reading any configs
+            last_update = datetime.utcnow()
+            handler = entry['factory']()
+            if tenant not in self.handler_cache.get(handler_name, {}):
+                # handler has been evicted meanwhile
+                return
+            self.register_handler(
+                handler_name, tenant, handler, entry['service_name'],
+                entry['factory'], last_update
+            )
+        except Exception as e:
+            # keep previous handler
+            self.logger.error(
+                "Could not reload handler '%s' for tenant '%s':\n%s" %
+                (handler_name, tenant, e)
+            )
+        finally:
+            with self.reload_lock:
+                self.reloading.discard((handler_name, tenant))
+
+    def start_polling(self):
+        """Start background thread checking for config changes."""
+        with self.reload_lock:
+            if self.poll_thread is not None:
+                return
+            self.poll_thread = threading.Thread(
+                target=self.poll_config_updates, daemon=True
+            )
+            self.poll_thread.start()
+
+    def poll_config_updates(self):
+        """Periodically reload any background handlers with changed
+        configs."""
+        while True:
+            time.sleep(max(self.config_check_interval, 1))
+            for handler_name, handlers in list(self.handler_cache.items()):
+                for tenant, handler in list(handlers.items()):
+                    if handler['background']:
+                        self.check_background_handler(
+                            handler_name, tenant, handler
+                        )
+
+    def check_background_handler(self, handler_name, tenant, handler):
+        """Reload background handler if its configs have changed.
+
+        :param str handler_name: Handler name
+        :param str tenant: Tenant ID
+        :param obj handler: Handler cache entry
+        """
+        last_update = self.last_config_update(
+            handler['service_name'], tenant
+        )
+        if not last_update or last_update >= handler['last_update']:
+            self.reload_handler(handler_name, tenant)
+
+    def watch_tenant(self, tenant):
+        """Watch config dir of tenant for changes if inotify is enabled and
+        return whether it is watched.
+
+        :param str tenant: Tenant ID
+        """
+        if self.watcher is None:
+            return False
+
+        path = PermissionsReader.permissions_file_path(tenant)
+        if not path:
+            return False
+        config_dir = os.path.dirname(path)
+        if self.watcher.add_watch(config_dir):
+            self.watched_dirs[config_dir] = tenant
+            return True
+
+        return False
+
+    def config_dir_changed(self, config_dir):
+        """Schedule config check for all handlers of a tenant on changes in
+        its config dir.
+
+        :param str config_dir: Tenant config dir
+        """
+        tenant = self.watched_dirs.get(config_dir)
+        # NOTE: count changes before scheduling checks, so concurrent
+        #       lookups do not skip checks for them
+        self.config_changes[tenant] = self.config_changes.get(tenant, 0) + 1
+        for handler_name, handlers in list(self.handler_cache.items()):
+            handler = handlers.get(tenant)
+            if handler:
+                if handler['background']:
+                    self.check_background_handler(
+                        handler_name, tenant, handler
+                    )
+                else:
+                    handler['next_check'] = 0
+
+    def after_fork(self):
+        """Reset background threads and check all handlers in child
+        process."""
+        if self.watcher is not None:
+            self.watcher.reset()
+        self.watched_dirs = {}
+        self.poll_thread = None
+        self.reloading = set()
+        self.reload_lock = threading.Lock()
+        # NOTE: any pending prewarm threads are not inherited
+        self.prewarming = 0
+        self.prewarm_lock = threading.Lock()
+        self.ready = threading.Event()
+        self.ready.set()
+        for handlers in self.handler_cache.values():
+            for handler in handlers.values():
+                handler['next_check'] = 0
+
+    def prewarm(self, service_name, handler_name, factory, tenants=None,
+                background=True):
+        """Pre-load service handlers for tenants in a thread pool.
+
+        Tenants default to PREWARM_TENANTS from env as comma separated list,
+        or '*' for all tenants with a service config in CONFIG_PATH.
+        The number of threads is set by PREWARM_WORKERS (default: 4).
+
+        NOTE: use background=False if handlers are pre-loaded before
+              forking worker processes
+
+        :param str service_name: Service name
+                                 (used for detecting config changes)
+        :param str handler_name: Handler name
+        :param func factory: Function returning a new service handler for
+                             a tenant
+        :param list tenants: Optional list of tenant IDs
+        :param bool background: Return immediately and load in background
+        """
+        if tenants is None:
+            prewarm_tenants = os.environ.get('PREWARM_TENANTS', '').strip()
+            if prewarm_tenants == '*':
+                tenants = self.discover_tenants(service_name)
+            else:
+                tenants = [
+                    tenant.strip() for tenant in prewarm_tenants.split(',')
+                    if tenant.strip()
+                ]
+        if not tenants:
+            return
+
+        with self.prewarm_lock:
+            self.prewarming += 1
+            self.ready.clear()
+
+        if background:
+            threading.Thread(
+                target=self.run_prewarm,
+                args=(service_name, handler_name, factory, tenants),
+                daemon=True
+            ).start()
+        else:
+            self.run_prewarm(service_name, handler_name, factory, tenants)
+
+    def run_prewarm(self, service_name, handler_name, factory, tenants):
+        """Load service handlers for tenants and signal readiness when done.
+
+        :param str service_name: Service name
+        :param str handler_name: Handler name
+        :param func factory: Function returning a new service handler for
+                             a tenant
+        :param list tenants: List of tenant IDs
+        """
+        def load(tenant):
+            if tenant in self.handler_cache.get(handler_name, {}):
+                # already loaded
+                return
+            try:
+                # NOTE: take timestamp before reading any configs
+                last_update = datetime.utcnow()
+                handler = factory(tenant)
+                self.register_handler(
+                    handler_name, tenant, handler, service_name,
+                    lambda: factory(tenant), last_update
+                )
+            except Exception as e:
+                self.logger.error(
+                    "Could not prewarm handler '%s' for tenant '%s':\n%s" %
+                    (handler_name, tenant, e)
+                )
+
+        self.logger.info(
+            "Prewarming handler '%s' for %d tenants" %
+            (handler_name, len(tenants))
+        )
+        try:
+            workers = int(os.environ.get('PREWARM_WORKERS', 4))
+            with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+                list(executor.map(load, tenants))
+        finally:
+            with self.prewarm_lock:
+                self.prewarming -= 1
+                if self.prewarming <= 0:
+                    self.ready.set()
+
+    def discover_tenants(self, service_name):
+        """Return sorted tenants with a service config in CONFIG_PATH.
+
+        :param str service_name: Service name
+        """
+        config_path = os.environ.get('CONFIG_PATH', 'config')
+        filename = '%sConfig.json' % service_name
+        tenants = []
+        try:
+            for entry in os.scandir(config_path):
+                if (
+                    entry.is_dir() and
+                    os.path.isfile(os.path.join(entry.path, filename))
+                ):
+                    tenants.append(entry.name)
+        except OSError as e:
+            self.logger.warning(
+                "Could not discover tenants in '%s':\n%s" % (config_path, e)
+            )
+
+        return sorted(tenants)
+
+    def is_ready(self):
+        """Return whether all pending prewarm() calls have completed."""
+        return self.ready.is_set()
+
     def last_config_update(self, service_name, tenant):
         """Return latest timestamp of config and permission files for a tenant.
 
@@ -129,13 +595,17 @@ class TenantHandler(TenantHandlerBase):
         last_config_update = None
         paths = [
             RuntimeConfig.config_file_path(service_name, tenant),
-            PermissionsReader.permissions_file_path(tenant)
+            PermissionsReader.permissions_file_path(tenant),
+            PermissionsReader.permissions_snapshot_path(tenant)
         ]
         for path in paths:
-            if os.path.isfile(path):
-                timestamp = datetime.utcfromtimestamp(
-                    os.path.getmtime(path)
-                )
+            try:
+                st = os.stat(path)
+            except (OSError, ValueError):
+                # file not found or invalid path
+                continue
+            if stat.S_ISREG(st.st_mode):
+                timestamp = datetime.utcfromtimestamp(st.st_mtime)
                 if (
                     last_config_update is None
                     or timestamp > last_config_update
@@ -1,7 +1,8 @@
 import glob
-import json
 import os
 
+from . import json_loader
+
 
 class Translator:
     """Class for translating strings via json files"""
@@ -25,7 +26,7 @@ class Translator:
         try:
             path = os.path.join(app.root_path, 'translations/%s.json' % locale)
             with open(path, 'r') as f:
-                self.translations = json.load(f)
+                self.translations = json_loader.load(f)
         except Exception as e:
             app.logger.error(
                 "Failed to load translation strings for locale '%s' from %s, loading default locale\n%s"
@@ -33,7 +34,7 @@ class Translator:
             )
             path = os.path.join(app.root_path, 'translations/%s.json' % DEFAULT_LOCALE)
             with open(path, 'r') as f:
-                self.translations = json.load(f)
+                self.translations = json_loader.load(f)
 
     def tr(self, msgId):
         """Translate a string.
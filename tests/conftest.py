@@ -0,0 +1,75 @@
+import pytest
+from sqlalchemy import event, text
+
+from qwc_services_core.config_models import ConfigModels
+from qwc_services_core.database import DatabaseEngine
+
+
+# minimal ConfigDB schema on SQLite
+CONFIGDB_DDL = [
+    "CREATE TABLE qwc_config.users (id INTEGER PRIMARY KEY, name TEXT, "
+    "description TEXT, password_hash TEXT, email TEXT)",
+    "CREATE TABLE qwc_config.user_infos (user_id INTEGER PRIMARY KEY "
+    "REFERENCES users(id))",
+    "CREATE TABLE qwc_config.groups (id INTEGER PRIMARY KEY, name TEXT, "
+    "description TEXT)",
+    "CREATE TABLE qwc_config.roles (id INTEGER PRIMARY KEY, name TEXT, "
+    "description TEXT)",
+    "CREATE TABLE qwc_config.groups_users (group_id INTEGER REFERENCES "
+    "groups(id), user_id INTEGER REFERENCES users(id), "
+    "PRIMARY KEY (group_id, user_id))",
+    "CREATE TABLE qwc_config.users_roles (user_id INTEGER REFERENCES "
+    "users(id), role_id INTEGER REFERENCES roles(id), "
+    "PRIMARY KEY (user_id, role_id))",
+    "CREATE TABLE qwc_config.groups_roles (group_id INTEGER REFERENCES "
+    "groups(id), role_id INTEGER REFERENCES roles(id), "
+    "PRIMARY KEY (group_id, role_id))",
+    "CREATE TABLE qwc_config.resource_types (name TEXT PRIMARY KEY, "
+    "description TEXT, list_order INTEGER)",
+    "CREATE TABLE qwc_config.resources (id INTEGER PRIMARY KEY, "
+    "parent_id INTEGER REFERENCES resources(id), "
+    "type TEXT REFERENCES resource_types(name), name TEXT)",
+    "CREATE TABLE qwc_config.permissions (id INTEGER PRIMARY KEY, "
+    "role_id INTEGER REFERENCES roles(id), "
+    "resource_id INTEGER REFERENCES resources(id), priority INTEGER, "
+    "write BOOLEAN)",
+    "CREATE TABLE qwc_config.registrable_groups (id INTEGER PRIMARY KEY, "
+    "group_id INTEGER REFERENCES groups(id), title TEXT, description TEXT)",
+    "CREATE TABLE qwc_config.registration_requests (id INTEGER PRIMARY KEY, "
+    "user_id INTEGER REFERENCES users(id), registrable_group_id INTEGER "
+    "REFERENCES registrable_groups(id), unsubscribe BOOLEAN, "
+    "created_at TIMESTAMP, pending BOOLEAN, accepted BOOLEAN)",
+    "CREATE TABLE qwc_config.last_update (updated_at TIMESTAMP)",
+    "CREATE TABLE qwc_config.alembic_version (version_num TEXT)",
+    "INSERT INTO qwc_config.alembic_version VALUES ('test')"
+]
+
+
+@pytest.fixture
+def config_db(tmp_path):
+    """DatabaseEngine and connection string for a ConfigDB on SQLite
+    attached as qwc_config."""
+    conn_str = 'sqlite:///%s' % (tmp_path / 'main.db')
+    config_db_path = str(tmp_path / 'qwc_config.db')
+
+    db_engine = DatabaseEngine()
+    engine = db_engine.db_engine(conn_str)
+
+    @event.listens_for(engine, 'connect')
+    def attach(dbapi_conn, record):
+        dbapi_conn.execute(
+            "ATTACH DATABASE ? AS qwc_config", (config_db_path,)
+        )
+
+    with engine.begin() as conn:
+        for ddl in CONFIGDB_DDL:
+            conn.execute(text(ddl))
+
+    return db_engine, conn_str
+
+
+@pytest.fixture
+def config_models(config_db):
+    """ConfigModels for a ConfigDB on SQLite attached as qwc_config."""
+    db_engine, conn_str = config_db
+    return ConfigModels(db_engine, conn_str)
@@ -0,0 +1,175 @@
+import os
+import random
+import threading
+import time
+
+import pytest
+
+from qwc_services_core.cache import Cache, ExpiringDict, SharedCacheBackend
+
+
+def shared_cache(path):
+    return Cache(backend=SharedCacheBackend(str(path)))
+
+
+def test_shared_cache_read_write(tmp_path):
+    cache = shared_cache(tmp_path / 'cache')
+    cache.write('svc', 'user', ['key'], {'a': [1, 2]}, 3600)
+    assert cache.read('svc', 'user', ['key']) == {'a': [1, 2]}
+    assert cache.read('svc', 'other', ['key']) is None
+    assert os.stat(tmp_path / 'cache').st_mode & 0o777 == 0o700
+
+
+def test_shared_cache_refuses_insecure_directory(tmp_path):
+    path = tmp_path / 'cache'
+    path.mkdir(mode=0o777)
+    os.chmod(path, 0o777)
+    with pytest.raises(Exception, match='must be a directory owned'):
+        SharedCacheBackend(str(path))
+
+
+def test_shared_cache_refuses_symlink(tmp_path):
+    target = tmp_path / 'target'
+    target.mkdir(mode=0o700)
+    os.symlink(target, tmp_path / 'cache')
+    with pytest.raises(Exception, match='must be a directory owned'):
+        SharedCacheBackend(str(tmp_path / 'cache'))
+
+
+def test_shared_cache_invalid_entry_is_miss(tmp_path):
+    backend = SharedCacheBackend(str(tmp_path / 'cache'))
+    cache = Cache(backend=backend)
+    cache_keys = cache.cache_keys('svc', 'user', ['key'])
+    path = backend.entry_path(cache_keys)
+
+    # truncated header
+    with open(path, 'wb') as fh:
+        fh.write(b'\x00\x01')
+    assert cache.read('svc', 'user', ['key']) is None
+    assert not os.path.exists(path)
+
+    # valid header with invalid payload
+    with open(path, 'wb') as fh:
+        fh.write(backend.HEADER.pack(2 ** 40, False) + b'invalid')
+    assert cache.read('svc', 'user', ['key']) is None
+
+
+def memory_cache_entries(cache):
+    return sum(len(stripe.lru) for stripe in cache.backend.stripes)
+
+
+def test_memory_cache_retains_entries_up_to_max_entries():
+    cache = Cache(max_entries=10, sweep_interval=3600)
+    for idx in range(10):
+        cache.write('svc', None, ['key%d' % idx], idx, 3600)
+    for idx in range(10):
+        assert cache.read('svc', None, ['key%d' % idx]) == idx
+    assert cache.backend.counter.value == 10
+
+
+def test_memory_cache_max_entries_is_upper_bound():
+    cache = Cache(max_entries=10, sweep_interval=3600)
+    for idx in range(100):
+        cache.write('svc', 'user%d' % (idx % 7), ['key%d' % idx], idx, 3600)
+        assert memory_cache_entries(cache) <= 10
+    assert memory_cache_entries(cache) == cache.backend.counter.value == 10
+    # last written entry is kept
+    assert cache.read('svc', 'user%d' % (99 % 7), ['key99']) == 99
+
+
+def run_threads(target, count=16):
+    """Run target(<thread index>) in threads and return raised errors."""
+    errors = []
+
+    def run(idx):
+        try:
+            target(idx)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [
+        threading.Thread(target=run, args=(idx,)) for idx in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+@pytest.mark.parametrize('frozen', [False, True])
+def test_cache_concurrent_read_write(frozen):
+    # bounded cache with frequent sweeps
+    cache = Cache(max_entries=200, sweep_interval=0, frozen=frozen, stripes=4)
+    services = ['svc%d' % idx for idx in range(3)]
+    users = [None, 'user', {'username': 'user', 'group': 'group'}]
+
+    def hammer(idx):
+        rnd = random.Random(idx)
+        for _ in range(3000):
+            service = rnd.choice(services)
+            identity = rnd.choice(users)
+            keys = ['key%d' % rnd.randrange(100)]
+            expected = {'service': service, 'keys': keys}
+            if rnd.random() < 0.5:
+                # write, some entries expire immediately
+                duration = rnd.choice([0, 3600])
+                cache.write(service, identity, keys, expected, duration)
+            else:
+                value = cache.read(service, identity, keys)
+                if value is not None:
+                    assert value['service'] == service
+                    assert list(value['keys']) == keys
+
+    assert run_threads(hammer) == []
+
+    entries = memory_cache_entries(cache)
+    assert entries <= 200
+    assert entries == cache.backend.counter.value
+
+
+def test_cache_concurrent_get_or_compute():
+    cache = Cache(stripes=4)
+    calls = []
+    calls_lock = threading.Lock()
+
+    def compute():
+        with calls_lock:
+            calls.append(1)
+        time.sleep(0.05)
+        return 'value'
+
+    results = []
+
+    def hammer(idx):
+        results.append(cache.get_or_compute(
+            'svc', None, ['key'], compute, 3600
+        ))
+
+    assert run_threads(hammer, 32) == []
+    assert results == ['value'] * 32
+    # computed once by single leader
+    assert len(calls) == 1
+
+
+def test_expiring_dict_concurrent_lookup_expire():
+    expiring_dict = ExpiringDict(max_entries=50)
+
+    def hammer(idx):
+        rnd = random.Random(idx)
+        for _ in range(5000):
+            key = rnd.randrange(100)
+            action = rnd.random()
+            if action < 0.4:
+                expiring_dict.set(key, [key], rnd.choice([0, 3600]))
+            elif action < 0.9:
+                entry = expiring_dict.lookup(key)
+                if entry is not None:
+                    assert entry['value'] == [key]
+            elif action < 0.95:
+                expiring_dict.remove(key)
+            else:
+                expiring_dict.expire()
+
+    assert run_threads(hammer) == []
+    assert len(expiring_dict) <= 50
@@ -0,0 +1,74 @@
+import logging
+import threading
+import time
+
+from sqlalchemy import text
+
+from qwc_services_core.cache import Cache
+from qwc_services_core.config_db_changes import ConfigDBChangeWatcher
+
+
+def init_last_update(models):
+    with models.engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO qwc_config.last_update "
+            "VALUES ('2024-01-01 00:00:00')"
+        ))
+
+
+def update(models, updated_at):
+    with models.engine.begin() as conn:
+        conn.execute(text(
+            "UPDATE qwc_config.last_update SET updated_at = :updated_at"
+        ), {'updated_at': updated_at})
+
+
+def wait_for(condition, timeout=5):
+    end = time.time() + timeout
+    while not condition():
+        if time.time() > end:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_invalidate_cache_on_change(config_models):
+    init_last_update(config_models)
+    watcher = ConfigDBChangeWatcher(
+        config_models, logging.getLogger(), interval=0.05
+    )
+    cache = Cache()
+    watcher.invalidate_cache(cache)
+    cache.write('svc', 'user', ['key'], 'data', 3600)
+
+    watcher.start()
+    try:
+        time.sleep(0.2)
+        # unchanged
+        assert cache.read('svc', 'user', ['key']) == 'data'
+
+        update(config_models, '2024-01-02 00:00:00')
+        assert wait_for(lambda: cache.read('svc', 'user', ['key']) is None)
+    finally:
+        watcher.stop()
+
+
+def test_change_before_fork_is_reported_in_child(config_models):
+    init_last_update(config_models)
+    watcher = ConfigDBChangeWatcher(
+        config_models, logging.getLogger(), interval=60
+    )
+    changed = threading.Event()
+    watcher.add_callback(changed.set)
+
+    watcher.start()
+    try:
+        # change after last poll in parent
+        update(config_models, '2024-01-02 00:00:00')
+        # simulate restart in child process
+        parent_stop_event = watcher.stop_event
+        watcher.after_fork()
+        parent_stop_event.set()
+        assert changed.wait(5)
+    finally:
+        watcher.stop()
@@ -0,0 +1,54 @@
+import logging
+
+from sqlalchemy import text
+
+from qwc_services_core.config_db_permissions import ConfigDBPermissionsLoader
+
+
+def test_load_permissions(config_models):
+    with config_models.engine.begin() as conn:
+        for sql in [
+            "INSERT INTO qwc_config.users (id, name) "
+            "VALUES (1, 'alice'), (2, 'bob')",
+            "INSERT INTO qwc_config.groups (id, name) "
+            "VALUES (1, 'editors'), (2, 'empty')",
+            "INSERT INTO qwc_config.roles (id, name) "
+            "VALUES (1, 'admin'), (2, 'editor'), (3, 'none')",
+            "INSERT INTO qwc_config.groups_users VALUES (1, 1)",
+            "INSERT INTO qwc_config.users_roles VALUES (1, 1)",
+            "INSERT INTO qwc_config.groups_roles VALUES (1, 2)",
+            "INSERT INTO qwc_config.resource_types (name) "
+            "VALUES ('map'), ('layer'), ('attribute')",
+            "INSERT INTO qwc_config.resources (id, parent_id, type, name) "
+            "VALUES (1, NULL, 'map', 'qwc'), (2, 1, 'layer', 'streets'), "
+            "(3, 2, 'attribute', 'id'), (4, 1, 'layer', 'parcels'), "
+            "(5, 4, 'attribute', 'id')",
+            "INSERT INTO qwc_config.permissions "
+            "(role_id, resource_id, priority, write) "
+            "VALUES (1, 1, 0, 0), (2, 2, 1, 1), (2, 3, 0, 0), (2, 5, 0, 0)"
+        ]:
+            conn.execute(text(sql))
+
+    permissions = ConfigDBPermissionsLoader(
+        config_models, logging.getLogger()
+    ).load_permissions()
+
+    assert permissions['users'] == {
+        'alice': ['admin', 'editor'],
+        'bob': []
+    }
+    assert permissions['groups'] == {'editors': ['editor'], 'empty': []}
+    assert permissions['roles']['none'] == {}
+    assert permissions['roles']['admin'] == {
+        'map': [
+            {'name': 'qwc', 'parent': None, 'writable': False, 'priority': 0}
+        ]
+    }
+    editor = permissions['roles']['editor']
+    assert editor['layer'] == [
+        {'name': 'streets', 'parent': 'qwc', 'writable': True, 'priority': 1}
+    ]
+    # same attribute name of different layers
+    assert sorted(p['parent'] for p in editor['attribute']) == [
+        'parcels', 'streets'
+    ]
@@ -0,0 +1,61 @@
+import logging
+import os
+import pickle
+
+import sqlalchemy
+
+from qwc_services_core.config_models import ConfigModels
+
+
+def test_reflection_cache(config_db, tmp_path, monkeypatch):
+    db_engine, conn_str = config_db
+    cache_dir = tmp_path / 'reflection'
+    monkeypatch.setenv('CONFIGDB_REFLECTION_CACHE_DIR', str(cache_dir))
+
+    ConfigModels(db_engine, conn_str)
+    assert os.stat(cache_dir).st_mode & 0o777 == 0o700
+    (cache_file,) = cache_dir.iterdir()
+    assert os.stat(cache_file).st_mode & 0o777 == 0o600
+
+    def reflect_tables(self, tables):
+        raise Exception("not cached")
+
+    monkeypatch.setattr(ConfigModels, 'reflect_tables', reflect_tables)
+    config_models = ConfigModels(db_engine, conn_str)
+    assert config_models.model('users') is not None
+
+
+def test_insecure_reflection_cache_dir_is_skipped(
+        config_db, tmp_path, monkeypatch, caplog):
+    db_engine, conn_str = config_db
+    cache_dir = tmp_path / 'reflection'
+    cache_dir.mkdir()
+    os.chmod(cache_dir, 0o777)
+    monkeypatch.setenv('CONFIGDB_REFLECTION_CACHE_DIR', str(cache_dir))
+
+    # plant cache file for all ConfigModels tables
+    planted = []
+
+    def reflection_cache_path(self, tables):
+        path = str(cache_dir / 'configdb_planted.pickle')
+        planted.append(path)
+        return path
+
+    monkeypatch.setattr(
+        ConfigModels, 'reflection_cache_path', reflection_cache_path
+    )
+    with open(cache_dir / 'configdb_planted.pickle', 'wb') as fh:
+        pickle.dump({
+            'schema_version': 'test',
+            'sqlalchemy_version': sqlalchemy.__version__,
+            'metadata': None
+        }, fh)
+
+    with caplog.at_level(logging.WARNING):
+        config_models = ConfigModels(
+            db_engine, conn_str, logger=logging.getLogger()
+        )
+    # live reflection without reading or writing cache files
+    assert config_models.model('users') is not None
+    assert "Skipping ConfigDB reflection cache" in caplog.text
+    assert planted == []
@@ -0,0 +1,87 @@
+import gc
+import os
+import weakref
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError
+
+from qwc_services_core.database import DATABASE_ENGINES, DatabaseEngine
+
+
+def test_database_engine_is_not_pinned_by_fork_hook():
+    db_engine = DatabaseEngine()
+    assert db_engine in DATABASE_ENGINES
+    ref = weakref.ref(db_engine)
+    del db_engine
+    gc.collect()
+    assert ref() is None
+
+
+def test_discard_inherited_pool_after_fork(tmp_path):
+    db_engine = DatabaseEngine()
+    engine = db_engine.db_engine('sqlite:///%s' % (tmp_path / 'test.db'))
+    with engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+    pool = engine.pool
+    assert pool.checkedin() == 1
+
+    pid = os.fork()
+    if pid == 0:
+        # child process
+        ok = engine.pool is not pool and engine.pool.checkedin() == 0
+        with engine.connect() as conn:
+            ok = ok and conn.execute(text('SELECT 1')).scalar() == 1
+        os._exit(0 if ok else 1)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    # parent keeps its pooled connection
+    assert engine.pool is pool
+    assert pool.checkedin() == 1
+
+
+def test_engines_for_different_pool_options(tmp_path):
+    db_engine = DatabaseEngine()
+    conn_str = 'sqlite:///%s' % (tmp_path / 'test.db')
+    engine = db_engine.db_engine(conn_str)
+    sized_engine = db_engine.db_engine(conn_str, {'pool_size': '2'})
+    assert sized_engine is not engine
+    assert sized_engine.pool.size() == 2
+    assert db_engine.db_engine(conn_str, {'pool_size': '2'}) is sized_engine
+    assert db_engine.db_engine(conn_str) is engine
+
+    stats = db_engine.pool_stats()
+    assert set(stats.keys()) == {conn_str, conn_str + '?pool_size=2'}
+
+
+def test_pool_stats(tmp_path):
+    db_engine = DatabaseEngine()
+    conn_str = 'sqlite:///%s?pool_size=1&max_overflow=0&pool_timeout=0.2' \
+        % (tmp_path / 'test.db')
+    engine = db_engine.db_engine(conn_str)
+    assert engine.url.query == {}
+
+    conn = engine.connect()
+    try:
+        with pytest.raises(TimeoutError):
+            engine.connect()
+    finally:
+        conn.close()
+    with engine.connect():
+        pass
+
+    stats = list(db_engine.pool_stats().values())[0]
+    assert stats['size'] == 1
+    assert stats['checked_out'] == 0
+    assert stats['checkouts'] == 3
+    assert stats['connects'] == 1
+    assert stats['max_wait_time'] >= 0.2
+
+    # statistics of recreated pool
+    engine.dispose()
+    with engine.connect():
+        pass
+    stats = list(db_engine.pool_stats().values())[0]
+    assert stats['checkouts'] == 1
+    assert stats['connects'] == 1
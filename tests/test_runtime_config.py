@@ -0,0 +1,77 @@
+import copy
+import json
+import logging
+import os
+import pickle
+
+import pytest
+
+from qwc_services_core import runtime_config
+from qwc_services_core.runtime_config import (
+    LazyResources, RuntimeConfig, write_split_config
+)
+
+
+@pytest.fixture
+def lazy_config(tmp_path, monkeypatch):
+    """Return RuntimeConfig read from a split config."""
+    monkeypatch.setenv('CONFIG_PATH', str(tmp_path))
+    monkeypatch.setattr(runtime_config, 'CONFIG_LAZY_ENABLED', True)
+    os.mkdir(tmp_path / 'default')
+    config_path = RuntimeConfig.config_file_path('test', 'default')
+    with open(config_path, 'w', encoding='utf-8') as fh:
+        json.dump({
+            'config': {'option': 1},
+            'resources': {
+                'layers': [{'name': 'a'}, {'name': 'b'}],
+                'themes': {'name': 'theme'}
+            }
+        }, fh)
+    write_split_config(
+        config_path, RuntimeConfig.split_config_file_path('test', 'default')
+    )
+
+    logger = logging.getLogger('test')
+    return RuntimeConfig('test', logger).read_config('default')
+
+
+def test_lazy_resources(lazy_config):
+    resources = lazy_config.resources()
+    assert isinstance(resources, LazyResources)
+    assert lazy_config.get('option') == 1
+    assert lazy_config.resource('themes') == {'name': 'theme'}
+    assert sorted(resources) == ['layers', 'themes']
+
+
+def test_lazy_resources_copies(lazy_config):
+    expected = {
+        'layers': [{'name': 'a'}, {'name': 'b'}],
+        'themes': {'name': 'theme'}
+    }
+
+    config = copy.deepcopy(lazy_config.config)
+    assert type(config['resources']) is dict
+    assert config['resources'] == expected
+    # deep copies do not share parsed resources
+    assert (
+        config['resources']['layers'] is not
+        lazy_config.resource('layers')
+    )
+
+    assert pickle.loads(pickle.dumps(lazy_config.resources())) == expected
+    assert copy.copy(lazy_config.resources()) == expected
+    assert json.loads(json.dumps(dict(lazy_config.resources()))) == expected
+
+
+def test_write_split_config_warning(tmp_path, monkeypatch, caplog):
+    monkeypatch.setenv('OPTION', '2')
+    config_path = tmp_path / 'testConfig.json'
+    config_path.write_text('{"config": {"option": $$OPTION$$}}')
+    split_config_path = tmp_path / 'testConfig.split'
+
+    with caplog.at_level(logging.WARNING):
+        write_split_config(str(config_path), str(split_config_path))
+    assert "Replacing env variables" in caplog.text
+    assert split_config_path.read_bytes().startswith(
+        b'{"config":{"config":{"option":2}}'
+    )
@@ -0,0 +1,59 @@
+from datetime import datetime
+import gc
+import logging
+import weakref
+
+from qwc_services_core.tenant_handler import TENANT_HANDLERS, TenantHandler
+
+
+def watched_tenant_handler(monkeypatch, on_check=None):
+    """Return TenantHandler with watched config dir for tenant 'default'
+    and unchanged configs."""
+    tenant_handler = TenantHandler(logging.getLogger())
+    monkeypatch.setattr(tenant_handler, 'watch_tenant', lambda tenant: True)
+    tenant_handler.watched_dirs['config/default'] = 'default'
+
+    def last_config_update(service_name, tenant):
+        if on_check:
+            on_check(tenant_handler)
+        return datetime(2000, 1, 1)
+
+    monkeypatch.setattr(
+        tenant_handler, 'last_config_update', last_config_update
+    )
+    return tenant_handler
+
+
+def test_skip_checks_until_notified(monkeypatch):
+    tenant_handler = watched_tenant_handler(monkeypatch)
+    tenant_handler.register_handler('handler', 'default', 'data')
+
+    assert tenant_handler.handler('service', 'handler', 'default') == 'data'
+    entry = tenant_handler.handler_cache['handler']['default']
+    assert entry['next_check'] == float('inf')
+
+    tenant_handler.config_dir_changed('config/default')
+    assert entry['next_check'] == 0
+
+
+def test_change_notified_during_check_is_not_lost(monkeypatch):
+    def on_check(tenant_handler):
+        # config changed after stat, but notified before lookup finished
+        tenant_handler.config_dir_changed('config/default')
+
+    tenant_handler = watched_tenant_handler(monkeypatch, on_check)
+    tenant_handler.register_handler('handler', 'default', 'data')
+
+    assert tenant_handler.handler('service', 'handler', 'default') == 'data'
+    entry = tenant_handler.handler_cache['handler']['default']
+    # check again on next lookup
+    assert entry['next_check'] == 0
+
+
+def test_tenant_handler_is_not_pinned_by_fork_hook():
+    tenant_handler = TenantHandler(logging.getLogger())
+    assert tenant_handler in TENANT_HANDLERS
+    ref = weakref.ref(tenant_handler)
+    del tenant_handler
+    gc.collect()
+    assert ref() is None